@@ -0,0 +1,207 @@
+"""
+JSON data API for the DWD Station Climate Plotter.
+Serves the history, forecast and PV columns of a station as compact columnar JSON, so the
+dashboard can load just the date range it is missing and redraw the chart in the browser.
+"""
+import hashlib
+from datetime import date, datetime
+
+import numpy as np
+from flask import Blueprint, request, jsonify, make_response
+
+import climate_stats
+import config
+import station_catalog
+import station_store
+import weather_logic
+from plotting import dumps, to_list, iso_dates
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+HISTORY_FIELDS = ("temp", "rain", "sun", "wind", "pv_actual", "pv_predicted")
+CLIMATE_FIELDS = tuple(climate_stats.column_names())
+FORECAST_FIELDS = ("temp", "rain", "sun", "wind", "pv_predicted")
+
+
+def _columns_payload(columns, fields):
+    payload = {"dates": iso_dates(columns["dates"])}
+    for field in fields:
+        values = np.asarray(columns[field], dtype=np.float64)
+        if not field.startswith("pv_"):
+            values = np.round(values, 3)  # float32 store values, rounded like the table rows
+        payload[field] = to_list(values)
+    return payload
+
+
+def table_to_columns(table, fields):
+    """Converts a weather_table.WeatherTable (None: no days) into the columnar API format."""
+    if table is None:
+        return {"dates": [], **{field: [] for field in fields}}
+    return _columns_payload({"dates": table.dates, **{field: table.display_column(field) for field in fields}}, fields)
+
+
+def _with_pv(columns, pv_sheet):
+    """Adds pv_actual/pv_predicted columns; both stay NaN if the PV sheet is unavailable."""
+    n = len(columns["dates"])
+    actual = predicted = np.full(n, np.nan)
+    if pv_sheet is not None and n:
+        try:
+            actual, predicted = weather_logic.pv_columns(
+                pv_sheet, columns["dates"], columns["temp"], columns["rain"], columns["sun"])
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"PV Enrichment Error: {exc}")
+    return {**columns, "pv_actual": actual, "pv_predicted": predicted}
+
+
+def _pv_sheet_or_none():
+    try:
+        return weather_logic.fetch_pv_sheet()
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        print(f"Fetch Error (pv): {exc}")
+        return None
+
+
+def _json_response(tag_parts, max_age, build):
+    """
+    Answers with 304 if the client already has the version described by tag_parts,
+    otherwise runs build() -> (payload, complete). Incomplete payloads (an upstream
+    source failed) are sent with Cache-Control: no-store and without ETag; payloads
+    with an "error" key are answered with 502.
+    """
+    etag = hashlib.sha1(repr((tag_parts, config.APP_VERSION)).encode("utf-8")).hexdigest()
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        payload, complete = build()
+        response = make_response(dumps(payload), 502 if "error" in payload else 200)
+        response.mimetype = "application/json"
+        if not complete:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return response
+
+
+def _parse_day(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+@api.route('/stations/<station_id>/history')
+def history(station_id):
+    """
+    Daily observations plus actual/predicted PV yield and the climate statistics (normals,
+    rolling means, anomalies) between ?from= and ?to= (ISO dates, inclusive). Defaults to the last DEFAULT_DAYS days. ?resolution=month|year returns the
+    precomputed aggregates of all periods starting in the range (without PV columns).
+    """
+    if weather_logic.station_name(station_id) is None:
+        return jsonify({"error": f"Unknown station {station_id}"}), 404
+
+    today = date.today()
+    try:
+        last = _parse_day("to", today)
+        first = _parse_day("from", date.fromordinal(today.toordinal() - config.DEFAULT_DAYS + 1))
+    except ValueError:
+        return jsonify({"error": "Dates must be given as YYYY-MM-DD"}), 400
+    if first > last or (last - first).days >= max(config.TIME_RANGES):
+        return jsonify({"error": f"Range must cover 1 to {max(config.TIME_RANGES)} days"}), 400
+    level = request.args.get('resolution', 'day')
+    if level not in ("day",) + tuple(station_store.AGGREGATE_LEVELS):
+        return jsonify({"error": "resolution must be day, month or year"}), 400
+
+    try:
+        versions = weather_logic.data_versions(station_id)
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        return jsonify({"error": str(exc)}), 502
+
+    def build():
+        try:
+            columns, _ = weather_logic.get_history_columns(
+                station_id, first.toordinal(), last.toordinal(), level, climate=True)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            return {"error": str(exc)}, False
+        if level != "day":
+            payload = _columns_payload(columns, HISTORY_FIELDS[:4])
+            payload.update(station_id=station_id, first=first.isoformat(), last=last.isoformat(), resolution=level)
+            return payload, True
+        pv_sheet = _pv_sheet_or_none()
+        fields = HISTORY_FIELDS + (CLIMATE_FIELDS if "temp_normal" in columns else ())
+        payload = _columns_payload(_with_pv(columns, pv_sheet), fields)
+        payload.update(station_id=station_id, first=first.isoformat(), last=last.isoformat())
+        return payload, pv_sheet is not None
+
+    tag = ("history", station_id, first, last, level, versions["day"], versions["dwd"], versions["pv"])
+    return _json_response(tag, config.API_MAX_AGE["history"], build)
+
+
+@api.route('/stations/<station_id>/forecast')
+def forecast(station_id):
+    """Forecast for the next ?days= days (see FORECAST_RANGES) with predicted PV yield."""
+    if weather_logic.station_coords(station_id) is None:
+        return jsonify({"error": f"Unknown station {station_id}"}), 404
+    try:
+        days_ahead = int(request.args.get('days', config.DEFAULT_FORECAST_DAYS))
+    except ValueError:
+        days_ahead = 0
+    if days_ahead not in config.FORECAST_RANGES:
+        return jsonify({"error": f"days must be one of {sorted(config.FORECAST_RANGES)}"}), 400
+
+    try:
+        versions = weather_logic.data_versions(station_id)
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        return jsonify({"error": str(exc)}), 502
+
+    def build():
+        try:
+            columns = weather_logic.get_forecast_columns(station_id, days_ahead)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            return {"error": str(exc)}, False
+        pv_sheet = _pv_sheet_or_none()
+        payload = _columns_payload(_with_pv(columns, pv_sheet), FORECAST_FIELDS)
+        payload.update(station_id=station_id, days=days_ahead)
+        return payload, pv_sheet is not None
+
+    tag = ("forecast", station_id, days_ahead, versions["day"], versions["forecast"], versions["pv"])
+    return _json_response(tag, config.API_MAX_AGE["forecast"], build)
+
+
+@api.route('/stations/<station_id>/changes')
+def changes(station_id):
+    """Latest DWD ingestion log entries of a station (appended and revised days), newest first."""
+    if weather_logic.station_name(station_id) is None:
+        return jsonify({"error": f"Unknown station {station_id}"}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    return jsonify({"station_id": station_id, "changes": station_store.last_changes(station_id, limit)})
+
+
+@api.route('/stations/nearest')
+def nearest():
+    """
+    DWD stations closest to ?lat=&lon=: the ?k= nearest (default 5), or with ?radius_km=
+    all stations within that distance. Each entry carries its distance_km.
+    """
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+        k = min(max(int(request.args.get('k', 5)), 1), 100)
+        radius_km = request.args.get('radius_km', type=float)
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon must be given as numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat/lon out of range"}), 400
+
+    try:
+        catalog = station_catalog.get_catalog()
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        return jsonify({"error": str(exc)}), 502
+    if radius_km is not None:
+        found = catalog.within(lat, lon, min(max(radius_km, 0.0), 1000.0))
+    else:
+        found = catalog.nearest(lat, lon, k)
+    stations = [{**station.to_dict(), "distance_km": round(distance, 2)} for station, distance in found]
+    return jsonify({"lat": lat, "lon": lon, "stations": stations})
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the request pipeline (python -m benchmarks.run) and for worker
+cold starts (python -m benchmarks.startup).
+"""
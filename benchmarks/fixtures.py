@@ -0,0 +1,254 @@
+"""
+Upstream fixtures for the benchmarks.
+A fixture set is a directory with one file per upstream URL (DWD directory listings,
+station description, station ZIPs, Open-Meteo JSON, PV sheet CSV) and a manifest.json
+mapping each URL to its file. Sets are either recorded from the real upstream servers
+(record) or generated deterministically (generate), and are replayed by FixtureAdapter,
+a requests transport adapter mounted on http_client.session, so no request leaves the
+machine.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import zipfile
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+import config
+import http_client
+import station_catalog
+
+MANIFEST = "manifest.json"
+
+_DWD_HEADER = ("STATIONS_ID;MESS_DATUM;QN_3;  FX;  FM;QN_4; RSK;RSKF; SDK;SHK_TAG;  NM; VPM;  PM; TMK;"
+               " UPM; TXK; TNK; TGK;eor")
+
+
+def _file_name(url):
+    """Stable, readable fixture file name for url."""
+    parts = urlsplit(url)
+    base = os.path.basename(parts.path.rstrip("/")) or parts.hostname
+    return f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}_{base}"
+
+
+def _write(fixture_dir, manifest, url, body, kind="static", content_type="application/octet-stream"):
+    name = _file_name(url)
+    with open(os.path.join(fixture_dir, name), "wb") as f_obj:
+        f_obj.write(body)
+    manifest[url] = {"file": name, "kind": kind, "content_type": content_type}
+
+
+def _save_manifest(fixture_dir, manifest, source):
+    with open(os.path.join(fixture_dir, MANIFEST), "w", encoding="utf-8") as f_obj:
+        json.dump({"source": source, "created": date.today().isoformat(), "urls": manifest}, f_obj, indent=1)
+
+
+def _listing(file_names):
+    links = "\n".join(f'<a href="{name}">{name}</a>' for name in file_names)
+    return f"<html><body><pre>\n{links}\n</pre></body></html>".encode("utf-8")
+
+
+def _open_meteo_location(lat, start, days, rng):
+    times = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    return {
+        "latitude": lat,
+        "daily": {
+            "time": times,
+            "temperature_2m_max": [round(12 + 8 * rng.random(), 1) for _ in times],
+            "temperature_2m_min": [round(2 + 6 * rng.random(), 1) for _ in times],
+            "precipitation_sum": [round(max(0.0, rng.gauss(1.5, 3.0)), 1) for _ in times],
+            "sunshine_duration": [round(36000 * rng.random()) for _ in times],
+            "wind_speed_10m_max": [round(5 + 20 * rng.random(), 1) for _ in times]
+        }
+    }
+
+
+def _station_zip(station_id, first, last, rng):
+    """DWD-style station ZIP with one produkt_klima_tag_ file (seasonal synthetic values)."""
+    lines = [_DWD_HEADER]
+    day = first
+    while day <= last:
+        season = math.cos(2 * math.pi * (day.timetuple().tm_yday - 200) / 365.25)
+        temp = round(10 + 9 * season + rng.gauss(0, 3), 1)
+        rain = round(max(0.0, rng.gauss(1.0, 3.0)), 1)
+        sun = round(max(0.0, 4.5 + 3.5 * season + rng.gauss(0, 2.5)), 3)
+        wind = round(10 + 8 * rng.random(), 1)
+        if rng.random() < 0.01:
+            temp = -999  # Missing values as DWD marks them
+        lines.append(f"{int(station_id):11d};{day:%Y%m%d};   10;{wind:6.1f};   3.9;    3;{rain:6.1f};   0;"
+                     f"{sun:7.3f};   0;   6.5;   8.6; 1003.41;{temp:7.1f};  74.71;  12.9;   4.4;   2.2;eor")
+        day += timedelta(days=1)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z_file:
+        z_file.writestr(f"produkt_klima_tag_{first:%Y%m%d}_{last:%Y%m%d}_{station_id}.txt",
+                        ("\r\n".join(lines) + "\r\n").encode("latin-1"))
+        z_file.writestr(f"Metadaten_Geographie_{station_id}.txt", b"-")
+    return buffer.getvalue()
+
+
+def _pv_sheet(first, last, rng):
+    lines = ["Tag,TagImJahr,Temperatur (°C),Niederschlag (mm),Sonnenstunden (h),PV-Ertrag (kWh)"]
+    day = first
+    while day <= last:
+        season = math.cos(2 * math.pi * (day.timetuple().tm_yday - 172) / 365.25)
+        sun = max(0.0, 4.5 + 3.5 * season + rng.gauss(0, 2.5))
+        lines.append(f"{day:%d.%m.%Y},{day.timetuple().tm_yday},{10 + 9 * season:.1f},"
+                     f"{max(0.0, rng.gauss(1, 3)):.1f},{sun:.2f},{max(0.0, 2 + 2.2 * sun + rng.gauss(0, 1)):.2f}")
+        day += timedelta(days=1)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def generate(fixture_dir, station_ids=None, today=None, seed=42):
+    """
+    Writes a deterministic synthetic fixture set for station_ids (default: config.STATIONS):
+    historical archives from 1991 to the end of last year, recent archives for the last
+    550 days up to yesterday, a station description, one Open-Meteo location and a PV sheet
+    covering the last 400 days.
+    """
+    station_ids = list(station_ids or config.STATIONS)
+    today = today or date.today()
+    rng = random.Random(seed)
+    os.makedirs(fixture_dir, exist_ok=True)
+    manifest = {}
+
+    recent_first, recent_last = today - timedelta(days=550), today - timedelta(days=1)
+    hist_first, hist_last = date(1991, 1, 1), date(today.year - 1, 12, 31)
+    recent_names, hist_names, description = [], [], [
+        "Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname Bundesland Abgabe",
+        "----------- --------- --------- ------------- --------- --------- ----------------------------------------- ---------- ------"]
+    for station_id in station_ids:
+        lat, lon = config.STATION_COORDS.get(station_id, (51.0, 10.0))
+        name = config.STATIONS.get(station_id, f"Station {station_id}")
+        description.append(f"{station_id} {hist_first:%Y%m%d} {recent_last:%Y%m%d} {100:14d} {lat:11.4f} {lon:9.4f} "
+                           f"{name:<40} {'Nordrhein-Westfalen':<40} Frei")
+
+        recent_name = f"tageswerte_KL_{station_id}_akt.zip"
+        _write(fixture_dir, manifest, config.DWD_URL + recent_name,
+               _station_zip(station_id, recent_first, recent_last, rng), content_type="application/zip")
+        recent_names.append(recent_name)
+        hist_name = f"tageswerte_KL_{station_id}_{hist_first:%Y%m%d}_{hist_last:%Y%m%d}_hist.zip"
+        _write(fixture_dir, manifest, config.DWD_HISTORICAL_URL + hist_name,
+               _station_zip(station_id, hist_first, hist_last, rng), content_type="application/zip")
+        hist_names.append(hist_name)
+
+    _write(fixture_dir, manifest, config.DWD_URL, _listing(recent_names), content_type="text/html")
+    _write(fixture_dir, manifest, config.DWD_HISTORICAL_URL, _listing(hist_names), content_type="text/html")
+    _write(fixture_dir, manifest, config.DWD_URL + station_catalog.DESCRIPTION_FILE,
+           ("\r\n".join(description) + "\r\n").encode("latin-1"), content_type="text/plain")
+    forecast = [_open_meteo_location(51.0, today, max(max(config.FORECAST_RANGES), 1), rng)]
+    _write(fixture_dir, manifest, config.FORECAST_API_URL, json.dumps(forecast).encode("utf-8"),
+           kind="open_meteo", content_type="application/json")
+    _write(fixture_dir, manifest, config.PV_DATA_URL, _pv_sheet(today - timedelta(days=400), recent_last, rng),
+           content_type="text/csv")
+    _save_manifest(fixture_dir, manifest, "generated")
+    return manifest
+
+
+def record(fixture_dir, station_ids=None):
+    """
+    Downloads the current upstream responses needed by station_ids (default: config.STATIONS)
+    into a fixture set. Needs network access; the result replays offline.
+    """
+    station_ids = list(station_ids or config.STATIONS)
+    os.makedirs(fixture_dir, exist_ok=True)
+    manifest = {}
+
+    def fetch(url, params=None):
+        response = http_client.get(url, params=params)
+        response.raise_for_status()
+        return response
+
+    for base_url in (config.DWD_URL, config.DWD_HISTORICAL_URL):
+        listing = fetch(base_url)
+        _write(fixture_dir, manifest, base_url, listing.content, content_type="text/html")
+        files = station_catalog.parse_listing(listing.text)
+        for station_id in station_ids:
+            if station_id in files:
+                url = base_url + files[station_id]
+                _write(fixture_dir, manifest, url, fetch(url).content, content_type="application/zip")
+    description_url = config.DWD_URL + station_catalog.DESCRIPTION_FILE
+    _write(fixture_dir, manifest, description_url, fetch(description_url).content, content_type="text/plain")
+
+    coords = [config.STATION_COORDS[sid] for sid in station_ids if sid in config.STATION_COORDS]
+    forecast = fetch(config.FORECAST_API_URL, params={
+        "latitude": ",".join(str(lat) for lat, _ in coords),
+        "longitude": ",".join(str(lon) for _, lon in coords),
+        "daily": ["temperature_2m_max", "temperature_2m_min", "precipitation_sum", "sunshine_duration", "wind_speed_10m_max"],
+        "timezone": "Europe/Berlin",
+        "models": "icon_d2",
+        "forecast_days": max(max(config.FORECAST_RANGES), 1)
+    }).json()
+    _write(fixture_dir, manifest, config.FORECAST_API_URL,
+           json.dumps(forecast if isinstance(forecast, list) else [forecast]).encode("utf-8"),
+           kind="open_meteo", content_type="application/json")
+    _write(fixture_dir, manifest, config.PV_DATA_URL, fetch(config.PV_DATA_URL).content, content_type="text/csv")
+    _save_manifest(fixture_dir, manifest, "recorded")
+    return manifest
+
+
+class FixtureAdapter(HTTPAdapter):
+    """
+    Transport adapter answering every request from a fixture set: static URLs by exact
+    match (with ETag revalidation), Open-Meteo by path with the recorded locations repeated
+    for as many coordinates as requested. Unknown URLs get 404. Counts served requests.
+    """
+
+    def __init__(self, fixture_dir):
+        super().__init__()
+        self.fixture_dir = fixture_dir
+        with open(os.path.join(fixture_dir, MANIFEST), "r", encoding="utf-8") as f_obj:
+            self.manifest = json.load(f_obj)["urls"]
+        self.by_path = {urlsplit(url)._replace(query="").geturl(): entry
+                        for url, entry in self.manifest.items() if entry["kind"] == "open_meteo"}
+        self._bodies = {}
+        self.requests = 0
+
+    def _body(self, entry):
+        if entry["file"] not in self._bodies:
+            with open(os.path.join(self.fixture_dir, entry["file"]), "rb") as f_obj:
+                self._bodies[entry["file"]] = f_obj.read()
+        return self._bodies[entry["file"]]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests += 1
+        entry = self.manifest.get(request.url)
+        parts = urlsplit(request.url)
+        if entry is None:
+            entry = self.by_path.get(parts._replace(query="").geturl())
+
+        if entry is None:
+            status, body, headers = 404, b"Not Found", {"Content-Type": "text/plain"}
+        elif entry["kind"] == "open_meteo":
+            locations = json.loads(self._body(entry))
+            count = len(parse_qs(parts.query).get("latitude", [""])[0].split(","))
+            answer = [locations[i % len(locations)] for i in range(count)]
+            body = json.dumps(answer[0] if count == 1 else answer).encode("utf-8")
+            status, headers = 200, {"Content-Type": entry["content_type"]}
+        else:
+            body = self._body(entry)
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers = {"Content-Type": entry["content_type"], "ETag": etag}
+            if request.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            else:
+                status = 200
+        headers["Content-Length"] = str(len(body))
+
+        raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status,
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+
+def install(fixture_dir):
+    """Mounts a FixtureAdapter for fixture_dir on the shared HTTP session and returns it."""
+    adapter = FixtureAdapter(fixture_dir)
+    http_client.session.mount("https://", adapter)
+    http_client.session.mount("http://", adapter)
+    return adapter
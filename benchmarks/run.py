@@ -0,0 +1,235 @@
+"""
+Benchmark harness for the request pipeline of the DWD Station Climate Plotter.
+Replays an upstream fixture set (see benchmarks/fixtures.py) through the shared HTTP
+session and times get_weather_data, get_forecast_data, enrich_with_pv_data, create_plot
+and the full index route for every station/range combination. Reports p50/p95 latency,
+peak and retained traced memory and the number of retained allocations per case, and
+compares against a stored baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.run                         # synthetic fixtures, print results
+    python -m benchmarks.run --save-baseline         # store results as the baseline
+    python -m benchmarks.run --compare --fail-on-regression
+    python -m benchmarks.run --record                # record real upstream fixtures (online)
+    python -m benchmarks.run --fixtures benchmarks/fixtures/recorded
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import config
+from benchmarks import fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, "fixtures", "generated")
+RECORDED_FIXTURES = os.path.join(BENCH_DIR, "fixtures", "recorded")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def _isolate(cache_dir):
+    """Points the app at a private cache and disables background work before it is imported."""
+    config.CACHE_DIR = cache_dir
+    config.PREFETCH_ENABLED = False
+    config.RESPONSE_CACHE_ENABLED = False  # The index case measures a full page build
+
+
+def _measure(fn, repeat):
+    """Runs fn once as warm-up, then repeat times; returns (result, [seconds])."""
+    result = fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, samples
+
+
+def _memory(fn):
+    """
+    Peak and retained traced memory (KiB) and retained allocations (memory blocks still
+    alive afterwards, e.g. cached arrays) of one fn() call. tracemalloc only sees live
+    blocks, so allocations that are freed again during the call are not counted.
+    """
+    tracemalloc.start()
+    try:
+        own_frames = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        snapshot = tracemalloc.take_snapshot().filter_traces(own_frames)
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().filter_traces(own_frames).compare_to(snapshot, "filename")
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count_diff for stat in stats)
+    return round((peak - before) / 1024, 1), round((current - before) / 1024, 1), blocks
+
+
+def _record_case(results, key, fn, repeat):
+    result, samples = _measure(fn, repeat)
+    peak_kib, retained_kib, retained_blocks = _memory(fn)
+    results[key] = {
+        "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 3),
+        "peak_kib": peak_kib,
+        "retained_kib": retained_kib,
+        "retained_blocks": retained_blocks,
+        "runs": repeat
+    }
+    return result
+
+
+def run(stations, time_ranges, forecast_ranges, repeat, compare_view=True):
+    """Runs all cases and returns {case key: stats}. Case keys are 'stage|station|days|fc_days'."""
+    # Imported here, after _isolate, so module-level setup sees the benchmark config
+    import flask_app  # pylint: disable=import-outside-toplevel
+    import plotting  # pylint: disable=import-outside-toplevel
+    import weather_logic  # pylint: disable=import-outside-toplevel
+
+    client = flask_app.app.test_client()
+    pv_sheet = weather_logic.fetch_pv_sheet()
+    results = {}
+    for station_id in stations:
+        for fc_days in forecast_ranges:
+            _record_case(results, f"get_forecast_data|{station_id}|-|{fc_days}",
+                         lambda s=station_id, f=fc_days: weather_logic.get_forecast_data(s, f), repeat)
+        forecast = weather_logic.get_forecast_data(station_id, config.DEFAULT_FORECAST_DAYS)
+
+        for days in time_ranges:
+            fc_days = config.DEFAULT_FORECAST_DAYS
+            history, _ = _record_case(results, f"get_weather_data|{station_id}|{days}|-",
+                                      lambda s=station_id, d=days: weather_logic.get_weather_data(d, s), repeat)
+            if history is None:
+                print(f"  skipped {station_id}/{days}: no history")
+                continue
+            _record_case(results, f"enrich_with_pv_data|{station_id}|{days}|{fc_days}",
+                         lambda h=history: weather_logic.enrich_with_pv_data(h, forecast, pv_sheet), repeat)
+            _record_case(results, f"create_plot|{station_id}|{days}|{fc_days}",
+                         lambda h=history: plotting.create_plot(h, forecast), repeat)
+
+            def index(s=station_id, d=days, f=fc_days):
+                response = client.get(f"/?station_id={s}&days={d}&fc_days={f}")
+                assert response.status_code == 200, response.status_code
+                return response
+            _record_case(results, f"index|{station_id}|{days}|{fc_days}", index, repeat)
+            print(f"  {station_id} {days:>5} days: index p50 {results[f'index|{station_id}|{days}|{fc_days}']['p50_ms']} ms")
+
+    if compare_view and len(stations) > 1:
+        for days in time_ranges:
+            fc_days = config.DEFAULT_FORECAST_DAYS
+            url = f"/?compare={','.join(stations)}&days={days}&fc_days={fc_days}"
+            _record_case(results, f"index_compare|{'+'.join(stations)}|{days}|{fc_days}",
+                         lambda u=url: client.get(u), repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every case against the baseline and returns the regressions:
+    cases whose p50 latency or peak memory grew by more than tolerance (e.g. 0.2 = 20 %).
+    """
+    regressions = []
+    print(f"\n{'case':<52} {'p50 ms':>10} {'base':>10} {'change':>8} {'peak KiB':>10} {'base':>10}")
+    for key, stats in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<52} {stats['p50_ms']:>10} {'-':>10} {'new':>8}")
+            continue
+        change = stats["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        memory_change = stats["peak_kib"] / base["peak_kib"] - 1 if base["peak_kib"] > 0 else 0.0
+        flag = " <-" if change > tolerance or memory_change > tolerance else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:<52} {stats['p50_ms']:>10} {base['p50_ms']:>10} {change:>+8.0%} "
+              f"{stats['peak_kib']:>10} {base['peak_kib']:>10}{flag}")
+    return regressions
+
+
+def _print_results(results):
+    print(f"\n{'case':<52} {'p50 ms':>10} {'p95 ms':>10} {'peak KiB':>10} {'retained KiB':>13} {'blocks':>8}")
+    for key, stats in sorted(results.items()):
+        print(f"{key:<52} {stats['p50_ms']:>10} {stats['p95_ms']:>10} {stats['peak_kib']:>10} "
+              f"{stats['retained_kib']:>13} {stats['retained_blocks']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--fixtures", default=None,
+                        help="fixture set to replay (default: recorded set if present, else generated)")
+    parser.add_argument("--record", action="store_true", help="record upstream fixtures (needs network) and exit")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the generated fixture set")
+    parser.add_argument("--stations", default=",".join(config.STATIONS), help="comma-separated station ids")
+    parser.add_argument("--ranges", default=",".join(str(d) for d in config.TIME_RANGES),
+                        help="comma-separated history ranges in days")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case (after one warm-up run)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50/peak growth before a case is flagged")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if a case is flagged")
+    args = parser.parse_args(argv)
+
+    stations = [s.strip() for s in args.stations.split(",") if s.strip()]
+    time_ranges = [int(d) for d in args.ranges.split(",") if d.strip()]
+
+    if args.record:
+        fixtures.record(args.fixtures or RECORDED_FIXTURES, stations)
+        print(f"Recorded fixtures to {args.fixtures or RECORDED_FIXTURES}")
+        return 0
+
+    fixture_dir = args.fixtures or (RECORDED_FIXTURES if os.path.exists(os.path.join(RECORDED_FIXTURES, fixtures.MANIFEST))
+                                    else DEFAULT_FIXTURES)
+    if fixture_dir == DEFAULT_FIXTURES and (args.regenerate or not os.path.exists(os.path.join(fixture_dir, fixtures.MANIFEST))):
+        fixtures.generate(fixture_dir, stations)
+    if not os.path.exists(os.path.join(fixture_dir, fixtures.MANIFEST)):
+        parser.error(f"{fixture_dir} contains no fixture set ({fixtures.MANIFEST} missing), "
+                     f"create one with --record --fixtures {fixture_dir}")
+
+    with tempfile.TemporaryDirectory(prefix="dwd_bench_") as cache_dir:
+        _isolate(cache_dir)
+        adapter = fixtures.install(fixture_dir)
+        print(f"Replaying {fixture_dir} ({len(adapter.manifest)} URLs), {args.repeat} runs per case")
+        started = time.perf_counter()
+        results = run(stations, time_ranges, sorted(config.FORECAST_RANGES), args.repeat)
+        print(f"Finished in {time.perf_counter() - started:.1f} s, {adapter.requests} upstream requests replayed")
+
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                 "app_version": config.APP_VERSION, "fixtures": os.path.relpath(fixture_dir), "repeat": args.repeat},
+        "results": results
+    }
+    _print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_obj:
+            json.dump(report, f_obj, indent=1)
+
+    status = 0
+    if args.compare:
+        try:
+            with open(args.baseline, "r", encoding="utf-8") as f_obj:
+                baseline = json.load(f_obj)["results"]
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"No usable baseline at {args.baseline}: {exc}")
+            baseline = None
+        if baseline is not None:
+            regressions = compare(results, baseline, args.tolerance)
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+            if regressions and args.fail_on_regression:
+                status = 1
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f_obj:
+            json.dump(report, f_obj, indent=1)
+        print(f"Baseline written to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark for the DWD Station Climate Plotter.
+Starts fresh interpreter processes the way a recycled or freshly deployed worker starts:
+each one imports flask_app and serves its first dashboard request against a shared, warm
+disk cache (upstream requests are answered from a fixture set, see benchmarks/fixtures.py).
+Reports the import time, the first-request time and the whole process lifetime, and which
+heavy modules were already loaded by the import.
+
+Usage (from the repository root):
+    python -m benchmarks.startup                 # 5 runs, print results
+    python -m benchmarks.startup --check         # exit 1 if a heavy module is imported eagerly
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from benchmarks import fixtures
+from benchmarks.run import DEFAULT_FIXTURES, RECORDED_FIXTURES
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only specific code paths need and that must not slow down `import flask_app`
+HEAVY_MODULES = ("pandas", "sklearn", "git", "torch", "chronos", "plotly", "matplotlib")
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import config
+config.CACHE_DIR = {cache_dir!r}
+config.PREFETCH_ENABLED = False
+import flask_app
+imported = time.perf_counter()
+eager = sorted(name for name in {heavy!r} if name in sys.modules)
+
+from benchmarks import fixtures
+fixtures.install({fixture_dir!r})
+client = flask_app.app.test_client()
+request_started = time.perf_counter()
+response = client.get({url!r})
+finished = time.perf_counter()
+print(json.dumps({{"import_s": imported - started, "first_request_s": finished - request_started,
+                  "status": response.status_code, "eager": eager}}))
+"""
+
+
+def _run_child(cache_dir, fixture_dir, url):
+    code = _CHILD.format(cache_dir=cache_dir, fixture_dir=fixture_dir, url=url, heavy=HEAVY_MODULES)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True,
+                               text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - started
+    return result
+
+
+def run(fixture_dir, station_id, repeat):
+    """One priming run to fill the disk cache, then repeat measured worker starts."""
+    url = f"/?station_id={station_id}&days={config.DEFAULT_DAYS}&fc_days={config.DEFAULT_FORECAST_DAYS}"
+    with tempfile.TemporaryDirectory(prefix="dwd_startup_") as cache_dir:
+        _run_child(cache_dir, fixture_dir, url)
+        samples = [_run_child(cache_dir, fixture_dir, url) for _ in range(repeat)]
+
+    stats = {}
+    for key in ("import_s", "first_request_s", "process_s"):
+        values = [sample[key] for sample in samples]
+        stats[key.replace("_s", "_ms")] = {"p50": round(float(np.percentile(values, 50)) * 1000, 1),
+                                           "max": round(max(values) * 1000, 1)}
+    stats["status"] = sorted({sample["status"] for sample in samples})
+    stats["eager_heavy_modules"] = sorted({name for sample in samples for name in sample["eager"]})
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--fixtures", default=None,
+                        help="fixture set to replay (default: recorded set if present, else generated)")
+    parser.add_argument("--station", default=next(iter(config.STATIONS)), help="station of the first request")
+    parser.add_argument("--repeat", type=int, default=5, help="measured worker starts")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 if importing flask_app loads one of the heavy modules")
+    args = parser.parse_args(argv)
+
+    fixture_dir = args.fixtures or (RECORDED_FIXTURES if os.path.exists(os.path.join(RECORDED_FIXTURES, fixtures.MANIFEST))
+                                    else DEFAULT_FIXTURES)
+    if fixture_dir == DEFAULT_FIXTURES and not os.path.exists(os.path.join(fixture_dir, fixtures.MANIFEST)):
+        fixtures.generate(fixture_dir, list(config.STATIONS))
+    if not os.path.exists(os.path.join(fixture_dir, fixtures.MANIFEST)):
+        parser.error(f"{fixture_dir} contains no fixture set ({fixtures.MANIFEST} missing), "
+                     f"create one with python -m benchmarks.run --record --fixtures {fixture_dir}")
+
+    stats = run(os.path.abspath(fixture_dir), args.station, args.repeat)
+    print(f"{'':<18} {'p50 ms':>10} {'max ms':>10}")
+    for key in ("import_ms", "first_request_ms", "process_ms"):
+        print(f"{key:<18} {stats[key]['p50']:>10} {stats[key]['max']:>10}")
+    print(f"status {stats['status']}, heavy modules loaded by the import: {stats['eager_heavy_modules'] or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_obj:
+            json.dump(stats, f_obj, indent=1)
+    return 1 if args.check and stats["eager_heavy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
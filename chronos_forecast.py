@@ -0,0 +1,291 @@
+"""
+Hourly Chronos-2 forecasts for the DWD Station Climate Plotter.
+Feeds the latest hourly DWD observations of all configured stations into the model saved
+by train_dwd_climate_chronos.py (one batched call on the CPU) and caches the 10/50/90 %
+quantiles until DWD publishes new observations. Requests only read the cached forecast:
+the model runs in the prefetch scheduler or in a background thread and is loaded once per
+process on first use. Needs torch and chronos-forecasting, which are optional dependencies.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+import config
+import http_cache
+import metrics
+import singleflight
+import station_catalog
+
+# Variate -> (DWD hourly directory, produkt_ column), in the order used for training
+HOURLY_PARAMETERS = {
+    "temp": ("air_temperature", "TT_TU"),
+    "rain": ("precipitation", "R1"),
+    "sun": ("sun", "SD_SO"),
+    "wind": ("wind", "F")
+}
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Physically possible ranges (see train_dwd_climate_chronos.PHYSICAL_BOUNDS)
+_BOUNDS = {"rain": (0, None), "sun": (0, 1.0), "wind": (0, None)}
+
+_state = {"key": None, "forecasts": {}, "checked_at": None, "loaded": False}
+_pipeline = {"value": None}
+_load_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def hourly_url(parameter):
+    """DWD directory of the 'recent' hourly archives of one parameter."""
+    return f"{config.DWD_HOURLY_URL}{HOURLY_PARAMETERS[parameter][0]}/recent/"
+
+
+def fetch_hourly_archives(station_id):
+    """{parameter: CacheEntry} of the recent hourly archives of station_id (None if one is missing)."""
+    entries = {}
+    for parameter in HOURLY_PARAMETERS:
+        base_url = hourly_url(parameter)
+        file_name = station_catalog.archive_name(base_url, station_id, config.DWD_LISTING_TTL)
+        if not file_name:
+            return None
+        entries[parameter] = http_cache.fetch(base_url + file_name, ttl=config.CHRONOS_REFRESH_INTERVAL)
+    return entries
+
+
+def read_hourly(path, column):
+    """(hours as datetime64[h] UTC, float64 values) of one column of a DWD hourly station ZIP."""
+    hours, values = [], []
+    with zipfile.ZipFile(path) as z_file:
+        data_filename = [n for n in z_file.namelist() if n.startswith("produkt_")][0]
+        with z_file.open(data_filename) as raw, io.TextIOWrapper(raw, encoding="latin-1") as f_obj:
+            reader = csv.reader(f_obj, delimiter=";", skipinitialspace=True)
+            header = [name.strip() for name in next(reader)]
+            date_idx, value_idx = header.index("MESS_DATUM"), header.index(column)
+            for fields in reader:
+                try:
+                    stamp = fields[date_idx].strip()
+                    value = float(fields[value_idx])
+                except (IndexError, ValueError):
+                    continue
+                hours.append(f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}T{stamp[8:10]}")
+                values.append(np.nan if value <= -900 else value)  # DWD marks missing values with -999
+    return np.array(hours, dtype="datetime64[h]"), np.array(values, dtype=np.float64)
+
+
+def time_covariates(hours):
+    """Hour-of-day and day-of-year sin/cos rows for datetime64[h] hours, as in training."""
+    hour = 2 * np.pi * (hours.astype(np.int64) % 24) / 24.0
+    day_of_year = (hours.astype("datetime64[D]") - hours.astype("datetime64[Y]")).astype(np.int64) + 1
+    day = 2 * np.pi * day_of_year / 365.25
+    return np.vstack([np.sin(hour), np.cos(hour), np.sin(day), np.cos(day)])
+
+
+def _ffill(rows):
+    """Forward-fills NaN gaps along axis 1 (leading NaNs stay, the model handles them)."""
+    idx = np.where(np.isnan(rows), 0, np.arange(rows.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return rows[np.arange(len(rows))[:, np.newaxis], idx]
+
+
+def build_context(archives, length):
+    """
+    Returns (context, last_hour): the (8, length) float32 model input ending at the last
+    hour with a temperature observation (weather variates, then time covariates) and
+    that hour. Sunshine is converted from minutes to hours per hour.
+    """
+    series = {name: read_hourly(entry.path, HOURLY_PARAMETERS[name][1]) for name, entry in archives.items()}
+    temp_hours, temp_values = series["temp"]
+    last_hour = temp_hours[~np.isnan(temp_values)].max()
+    grid = np.arange(last_hour - length + 1, last_hour + 1)
+
+    weather = np.full((len(HOURLY_PARAMETERS), length), np.nan)
+    for i, name in enumerate(HOURLY_PARAMETERS):
+        hours, values = series[name]
+        pos = (hours - grid[0]).astype(np.int64)
+        inside = (pos >= 0) & (pos < length)
+        weather[i, pos[inside]] = values[inside] / (60.0 if name == "sun" else 1.0)
+    return np.vstack([_ffill(weather), time_covariates(grid)]).astype(np.float32), last_hour
+
+
+def _model_source():
+    return config.CHRONOS_MODEL_DIR if os.path.isdir(config.CHRONOS_MODEL_DIR) else config.CHRONOS_BASE_MODEL
+
+
+def get_pipeline():
+    """The Chronos-2 pipeline on the CPU, loaded on first use and kept for the process lifetime."""
+    with _load_lock:
+        if _pipeline["value"] is None:
+            import torch  # pylint: disable=import-outside-toplevel
+            from chronos import Chronos2Pipeline  # pylint: disable=import-outside-toplevel
+
+            if config.CHRONOS_THREADS:
+                torch.set_num_threads(config.CHRONOS_THREADS)
+            with metrics.stage("chronos_load"):
+                pipeline = Chronos2Pipeline.from_pretrained(
+                    _model_source(), device_map="cpu",
+                    torch_dtype=torch.bfloat16 if config.CHRONOS_DTYPE == "bfloat16" else torch.float32
+                )
+                if config.CHRONOS_DTYPE == "int8":
+                    # Dynamic int8 quantization of the linear layers (CPU only)
+                    pipeline.model = torch.ao.quantization.quantize_dynamic(
+                        pipeline.model, {torch.nn.Linear}, dtype=torch.qint8)
+                pipeline.model.eval()
+            print(f"Chronos: loaded {_model_source()} ({config.CHRONOS_DTYPE})")
+            _pipeline["value"] = pipeline
+    return _pipeline["value"]
+
+
+def predict(contexts):
+    """Quantile forecasts (n, n_variates, CHRONOS_PREDICTION_HOURS, len(QUANTILES)) for a batch of contexts."""
+    import torch  # pylint: disable=import-outside-toplevel
+
+    pipeline = get_pipeline()
+    with metrics.stage("chronos_predict"), torch.inference_mode():
+        quantiles, _ = pipeline.predict_quantiles(
+            torch.from_numpy(contexts),
+            prediction_length=config.CHRONOS_PREDICTION_HOURS,
+            quantile_levels=list(QUANTILES),
+            batch_size=len(contexts)
+        )
+    return np.stack([q.float().cpu().numpy() for q in quantiles])
+
+
+def _cache_path():
+    return os.path.join(config.CACHE_DIR, "chronos", "forecast.json")
+
+
+def _remember(data):
+    forecasts = {}
+    for station_id, stored in data["forecasts"].items():
+        start = np.datetime64(stored["start"], "h")
+        columns = {name: np.array(values, dtype=np.float64) for name, values in stored["columns"].items()}
+        horizon = len(next(iter(columns.values())))
+        hours = np.arange(start, start + horizon)
+        columns["times"] = np.datetime_as_string(hours, unit="m").tolist()
+        forecasts[station_id] = columns
+    _state.update(key=data["key"], forecasts=forecasts)
+
+
+def _load_disk():
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as f_obj:
+            return json.load(f_obj)
+    except (OSError, ValueError):
+        return None
+
+
+def _compute(key, archives):
+    """Runs the model for all stations in archives (unless another process already did) and stores the result."""
+    stored = _load_disk()
+    if stored is not None and stored.get("key") == key:
+        _remember(stored)
+        return
+
+    station_ids, contexts, last_hours = [], [], []
+    for station_id, entries in archives.items():
+        try:
+            context, last_hour = build_context(entries, config.CHRONOS_CONTEXT_HOURS)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Chronos: no usable hourly data for station {station_id} ({exc})")
+            continue
+        station_ids.append(station_id)
+        contexts.append(context)
+        last_hours.append(last_hour)
+    if not station_ids:
+        return
+
+    quantiles = predict(np.stack(contexts))
+    forecasts = {}
+    for i, station_id in enumerate(station_ids):
+        columns = {}
+        for j, name in enumerate(HOURLY_PARAMETERS):
+            values = quantiles[i, j]
+            if name in _BOUNDS:
+                values = np.clip(values, *_BOUNDS[name])
+            for k, level in enumerate(QUANTILES):
+                columns[f"{name}_q{round(level * 100)}"] = np.round(values[:, k].astype(np.float64), 3).tolist()
+        forecasts[station_id] = {"start": str(last_hours[i] + 1), "columns": columns}
+
+    data = {"key": key, "computed_at": time.time(), "forecasts": forecasts}
+    os.makedirs(os.path.dirname(_cache_path()), exist_ok=True)
+    http_cache.atomic_write(_cache_path(), json.dumps(data).encode("utf-8"))
+    _remember(data)
+
+
+def refresh():
+    """
+    Revalidates the hourly archives of all configured stations and runs the model once,
+    for all stations in one batch, if any archive (or the model) changed. Returns the
+    key of the current forecast.
+    """
+    if not config.CHRONOS_ENABLED:
+        return None
+    archives = {}
+    for station_id in config.STATIONS:
+        try:
+            entries = fetch_hourly_archives(station_id)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Chronos: hourly archives of station {station_id} unavailable ({exc})")
+            continue
+        if entries is not None:
+            archives[station_id] = entries
+
+    model_dir = config.CHRONOS_MODEL_DIR
+    model_version = os.path.getmtime(model_dir) if os.path.isdir(model_dir) else config.CHRONOS_BASE_MODEL
+    versions = sorted((sid, name, entry.version) for sid, entries in archives.items() for name, entry in entries.items())
+    key = hashlib.sha1(repr((versions, model_version, config.CHRONOS_DTYPE, config.CHRONOS_CONTEXT_HOURS,
+                             config.CHRONOS_PREDICTION_HOURS)).encode("utf-8")).hexdigest()
+    if archives and _state["key"] != key:
+        singleflight.do(("chronos", key), lambda: _compute(key, archives), across_processes=True)
+    _state["checked_at"] = time.monotonic()
+    return _state["key"]
+
+
+def _refresh_in_background():
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    _state["checked_at"] = time.monotonic()  # At most one attempt per interval, even if it fails
+
+    def run():
+        try:
+            refresh()
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Chronos: background refresh failed ({exc})")
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name="chronos-refresh", daemon=True).start()
+
+
+def get_hourly_forecast(station_id):
+    """
+    Cached hourly forecast of station_id as {"times": ISO hours (UTC), "temp_q10", "temp_q50",
+    "temp_q90", "rain_q10", ...} (None if disabled or not available yet). Never runs the
+    model itself: a forecast older than CHRONOS_REFRESH_INTERVAL is served while a
+    background thread checks for new observations.
+    """
+    if not config.CHRONOS_ENABLED:
+        return None
+    if not _state["loaded"]:
+        _state["loaded"] = True
+        stored = _load_disk()
+        if stored is not None:
+            _remember(stored)
+    checked_at = _state["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at > config.CHRONOS_REFRESH_INTERVAL:
+        _refresh_in_background()
+
+    forecast = _state["forecasts"].get(station_id)
+    metrics.inc("cache_lookups_total", cache="chronos", result="hit" if forecast is not None else "miss")
+    return forecast
+
+
+def version():
+    """Key of the forecast currently held in memory (None if there is none)."""
+    return _state["key"] if config.CHRONOS_ENABLED else None
@@ -0,0 +1,239 @@
+"""
+Climatology and rolling statistics for the DWD Station Climate Plotter.
+Computes, per station and over its full merged record, the daily climate normal (mean and
+percentiles per day of year over the reference period), trailing rolling means and the
+anomalies against the normal. Results are cached in memory and as .npz and, when new
+days arrive, only the affected tail is recomputed.
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+import config
+import metrics
+import singleflight
+
+STAT_COLUMNS = ("temp", "rain", "sun")
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+_memory = {}
+_lock = threading.Lock()
+
+
+def day_index(ordinals):
+    """Day of year on a 366-day calendar (0..365), so 1 March is index 60 in every year."""
+    days = (np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+    years = days.astype("datetime64[Y]")
+    index = (days - years).astype(np.int64)
+    year = years.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return index + ((~leap) & (index >= 59))
+
+
+def rolling_mean(values, window):
+    """
+    Trailing mean over the last window values, ignoring NaN. Days with fewer than half
+    of the window available are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    window_sums, window_counts = sums[end] - sums[start], counts[end] - counts[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = window_sums / window_counts
+    means[window_counts < window // 2 + 1] = np.nan
+    return means
+
+
+def _normals(dates, values):
+    """Mean and CLIMATE_PERCENTILES per day index over the reference period."""
+    first_year, last_year = config.CLIMATE_REFERENCE_PERIOD
+    years = (dates.astype(np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+    in_period = (years >= first_year) & (years <= last_year)
+
+    # Year x day-of-year matrix, then pool +/- CLIMATE_POOL_DAYS around each day
+    grid = np.full((last_year - first_year + 1, 366), np.nan)
+    grid[years[in_period] - first_year, day_index(dates[in_period])] = values[in_period]
+    offsets = np.arange(-config.CLIMATE_POOL_DAYS, config.CLIMATE_POOL_DAYS + 1)
+    pooled = grid[:, (np.arange(366)[:, None] + offsets) % 366]  # years x 366 x pool
+    pooled = pooled.transpose(1, 0, 2).reshape(366, -1)
+
+    result = {"mean": np.full(366, np.nan)}
+    result.update({f"p{p}": np.full(366, np.nan) for p in config.CLIMATE_PERCENTILES})
+    has_data = ~np.all(np.isnan(pooled), axis=1)
+    if has_data.any():
+        result["mean"][has_data] = np.nanmean(pooled[has_data], axis=1)
+        for percentile, levels in zip(config.CLIMATE_PERCENTILES,
+                                      np.nanpercentile(pooled[has_data], config.CLIMATE_PERCENTILES, axis=1)):
+            result[f"p{percentile}"][has_data] = levels
+    return result
+
+
+def column_names():
+    """Names of the per-day columns returned by StationStats.columns."""
+    names = []
+    for column in STAT_COLUMNS:
+        names.append(f"{column}_normal")
+        names.extend(f"{column}_normal_p{p}" for p in config.CLIMATE_PERCENTILES)
+        names.extend(f"{column}_mean_{window}" for window in config.ROLLING_WINDOWS)
+        names.append(f"{column}_anomaly")
+    return names
+
+
+class StationStats:
+    """
+    Statistics aligned with the daily columns of a station_store.StationData:
+    normals[column][stat] has 366 entries (see day_index), rolling[(column, window)] and
+    anomaly[column] one entry per day of the record.
+    """
+
+    def __init__(self, version, dates, source, normals, rolling, anomaly):
+        self.version = version
+        self.dates = dates
+        self.source = source  # Input values, to find the first changed day on updates
+        self.normals = normals
+        self.rolling = rolling
+        self.anomaly = anomaly
+
+    def columns(self, window):
+        """Flat {name: array} of all per-day statistics for an index slice of the record."""
+        index = day_index(self.dates[window])
+        result = {}
+        for column in STAT_COLUMNS:
+            for stat, values in self.normals[column].items():
+                result[f"{column}_normal" if stat == "mean" else f"{column}_normal_{stat}"] = values[index]
+            for rolling_window in config.ROLLING_WINDOWS:
+                result[f"{column}_mean_{rolling_window}"] = self.rolling[(column, rolling_window)][window]
+            result[f"{column}_anomaly"] = self.anomaly[column][window]
+        return result
+
+
+def _compute(data, previous=None):
+    """
+    Computes the statistics of data. With previous stats of an older version, everything
+    before the first changed day is reused and the normals are kept unless that day lies
+    inside the reference period.
+    """
+    n = len(data.dates)
+    source = {column: getattr(data, column).astype(np.float64) for column in STAT_COLUMNS}
+    changed = 0
+    if previous is not None:
+        m = min(n, len(previous.dates))
+        same = previous.dates[:m] == data.dates[:m]
+        for column in STAT_COLUMNS:
+            old, new = previous.source[column][:m], source[column][:m]
+            same &= (old == new) | (np.isnan(old) & np.isnan(new))
+        changed = int(np.argmin(same)) if not same.all() else m
+
+    reference_end = np.datetime64(f"{config.CLIMATE_REFERENCE_PERIOD[1] + 1}-01-01").astype(np.int64) + _EPOCH_ORDINAL
+    reuse_normals = previous is not None and (changed == n or data.dates[changed] >= reference_end)
+    normals = previous.normals if reuse_normals else {
+        column: _normals(data.dates, source[column]) for column in STAT_COLUMNS}
+    start = changed if reuse_normals else 0
+
+    rolling, anomaly = {}, {}
+    for column in STAT_COLUMNS:
+        anomaly[column] = np.empty(n)
+        anomaly[column][start:] = source[column][start:] - normals[column]["mean"][day_index(data.dates[start:])]
+        for window in config.ROLLING_WINDOWS:
+            values = np.empty(n)
+            context = max(start - window + 1, 0)  # Earlier days the recomputed tail depends on
+            values[start:] = rolling_mean(source[column][context:], window)[start - context:]
+            rolling[(column, window)] = values
+        if start:
+            anomaly[column][:start] = previous.anomaly[column][:start]
+            for window in config.ROLLING_WINDOWS:
+                rolling[(column, window)][:start] = previous.rolling[(column, window)][:start]
+
+    return StationStats(data.version, data.dates, source, normals, rolling, anomaly)
+
+
+def _store_path(station_id):
+    return os.path.join(config.CACHE_DIR, "stats", f"{station_id}.npz")
+
+
+def _save(station_id, stats):
+    arrays = {"dates": stats.dates}
+    for column in STAT_COLUMNS:
+        arrays[f"source_{column}"] = stats.source[column]
+        arrays[f"anomaly_{column}"] = stats.anomaly[column]
+        for stat, values in stats.normals[column].items():
+            arrays[f"normal_{column}_{stat}"] = values
+        for window in config.ROLLING_WINDOWS:
+            arrays[f"rolling_{column}_{window}"] = stats.rolling[(column, window)]
+
+    path = _store_path(station_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f_obj:
+            np.savez(f_obj, version=np.array(stats.version or ""), settings=np.array(_settings()), **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _settings():
+    return repr((config.CLIMATE_REFERENCE_PERIOD, config.CLIMATE_PERCENTILES,
+                 config.CLIMATE_POOL_DAYS, config.ROLLING_WINDOWS))
+
+
+def _load(station_id):
+    try:
+        with np.load(_store_path(station_id)) as npz:
+            if str(npz["settings"]) != _settings():
+                return None
+            stats = StationStats(
+                str(npz["version"]), npz["dates"],
+                {column: npz[f"source_{column}"] for column in STAT_COLUMNS},
+                {column: {"mean": npz[f"normal_{column}_mean"],
+                          **{f"p{p}": npz[f"normal_{column}_p{p}"] for p in config.CLIMATE_PERCENTILES}}
+                 for column in STAT_COLUMNS},
+                {(column, window): npz[f"rolling_{column}_{window}"]
+                 for column in STAT_COLUMNS for window in config.ROLLING_WINDOWS},
+                {column: npz[f"anomaly_{column}"] for column in STAT_COLUMNS}
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+    return stats
+
+
+def get_stats(station_id, data):
+    """
+    Returns the StationStats for a station_store.StationData. Stats of an older version
+    (in memory or on disk) are updated incrementally instead of being recomputed.
+    """
+    with _lock:
+        cached = _memory.get(station_id)
+    if cached is not None and cached.version == data.version:
+        metrics.inc("cache_lookups_total", cache="climate_stats", result="hit")
+        return cached
+
+    metrics.inc("cache_lookups_total", cache="climate_stats", result="miss")
+    with metrics.stage("climate_stats"):
+        return singleflight.do(
+            ("climate_stats", station_id, data.version),
+            lambda: _load_or_compute(station_id, data, cached),
+            across_processes=True
+        )
+
+
+def _load_or_compute(station_id, data, previous):
+    stored = _load(station_id)
+    if stored is not None and stored.version == data.version:
+        stats = stored
+    else:
+        stats = _compute(data, previous if previous is not None else stored)
+        _save(station_id, stats)
+
+    with _lock:
+        _memory[station_id] = stats
+    return stats
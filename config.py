@@ -1,6 +1,7 @@
 """
 Configuration settings for data retrieval and automatic release on PythonAnywhere with GitHub webhook.
 """
+import os
 
 # Your secret token for the GitHub Webhook.
 WEBHOOK_SECRET = "MY_SUPER_SECRET_TOKEN_123"
@@ -27,7 +28,10 @@ TIME_RANGES = {
     60: "last 60 days",
     90: "last 90 days",
     182: "last 6 months",
-    365: "last year"
+    365: "last year",
+    1826: "last 5 years",
+    3652: "last 10 years",
+    10957: "last 30 years"
 }
 
 # Range for forecast data query
@@ -42,10 +46,105 @@ DEFAULT_FORECAST_DAYS = 1
 
 # DWD OpenData Base URL
 DWD_URL = "https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/daily/kl/recent/"
+# Quality-controlled long-term archives (updated about once a year), merged with DWD_URL
+DWD_HISTORICAL_URL = "https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/daily/kl/historical/"
+
+# Hourly observations (air_temperature, precipitation, sun, wind), used by the Chronos forecast
+DWD_HOURLY_URL = "https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/"
+
+# LOCAL CACHE SETTINGS
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # LRU eviction of the whole cache directory kicks in above this size
+DWD_LISTING_TTL = 3600  # Seconds before the DWD directory listing is revalidated
+DWD_ZIP_TTL = 6 * 3600  # Seconds before a station ZIP is revalidated (DWD updates daily)
+DWD_HISTORICAL_TTL = 7 * 24 * 3600  # Seconds before the historical listing and ZIPs are revalidated
+CATALOG_TTL = 24 * 3600  # Seconds before the DWD station description file is revalidated
+CATALOG_GRID_DEGREES = 0.5  # Cell size of the lat/lon grid used for nearest-station lookups
+STATION_CHANGES_MAX_BYTES = 256 * 1024  # Size at which a station's change log is shortened ...
+STATION_CHANGES_KEEP = 200  # ... to its last entries
+
+# HTTP CLIENT SETTINGS
+HTTP_POOL_HOSTS = 4  # Number of per-host connection pools kept alive
+HTTP_POOL_SIZE_PER_HOST = 8
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5  # Sleeps 0.5 s, 1 s, 2 s between retries
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_DEFAULT_TIMEOUT = 20
+HTTP_TIMEOUTS = {  # Read timeouts in seconds per upstream host
+    "opendata.dwd.de": 30,
+    "api.open-meteo.com": 5,
+    "docs.google.com": 15
+}
+
+# CONCURRENT FETCH SETTINGS
+FETCH_WORKERS = 8  # Threads shared by all requests for upstream downloads
+FETCH_DEADLINES = {  # Seconds each source may take before the page is rendered without it
+    "history": 45,
+    "forecast": 8,
+    "pv": 15
+}
+
+# Open-Meteo forecast API (all stations are requested in one call per model run)
+FORECAST_API_URL = "https://api.open-meteo.com/v1/forecast"
+# Open-Meteo publishes a new ICON-D2 run every 3 hours
+FORECAST_RUN_INTERVAL_HOURS = 3
+FORECAST_TIMEZONE = "Europe/Berlin"  # Daily forecast values start at midnight in this time zone
+
+# RESPONSE CACHE SETTINGS
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_CHECK_INTERVAL = 60  # Seconds between upstream version checks per cached page
+RESPONSE_CACHE_STALE_WHILE_REVALIDATE = False  # Serve the old page while a new one renders
+RESPONSE_CACHE_MAX_ENTRIES = 256  # Max. cached pages; beyond it only configured-station pages are kept
+
+# BACKGROUND PREFETCH SETTINGS
+PREFETCH_ENABLED = False  # Start the prefetch scheduler in flask_app.init() (needs threads in web workers)
+PREFETCH_INTERVALS = {  # Seconds between refreshes per upstream source
+    "dwd": 3600,
+    "forecast": 1800,
+    "pv": 600,
+    "chronos": 3600
+}
+PREFETCH_JITTER = 0.1  # Intervals vary by +/- 10 % so workers do not fire in lockstep
+PREFETCH_STARTUP_DELAY = 10  # Max. random delay (s) before the first run after start-up
+
+# PLOT SETTINGS
+PLOT_MAX_POINTS = 1000  # Longer histories are downsampled before they are sent to the browser
+AGGREGATE_ABOVE_DAYS = 730  # Longer history windows are shown as monthly means/totals
+COMPARE_MAX_STATIONS = 12  # Max. number of stations in one comparison view (?compare=a,b,c)
+COMPARE_HISTORY_WORKERS = 3  # Max. concurrent history downloads of all comparisons together (< FETCH_WORKERS)
+
+# JSON DATA API SETTINGS (/api/v1)
+API_MAX_AGE = {  # Seconds browsers and proxies may reuse an API response without revalidating
+    "history": 3600,
+    "forecast": 900
+}
+
+# METRICS SETTINGS (/metrics)
+METRICS_ENABLED = True  # Record stage/upstream/cache metrics and serve them in Prometheus format
+METRICS_TOKEN = None  # If set, /metrics requires ?token=<METRICS_TOKEN>
+SERVER_TIMING_ENABLED = False  # Add a Server-Timing header with the stage durations to each response
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Histogram bounds (s)
+
+# CHRONOS HOURLY FORECAST SETTINGS (needs torch and chronos-forecasting)
+CHRONOS_ENABLED = False  # Show the hourly Chronos-2 forecast (10/50/90 % bands) in the dashboard plot
+CHRONOS_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chronos_dwd_finetuned")
+CHRONOS_BASE_MODEL = "amazon/chronos-2"  # Used (zero-shot) if CHRONOS_MODEL_DIR does not exist
+CHRONOS_DTYPE = "bfloat16"  # "float32", "bfloat16" or "int8" (dynamic quantization on the CPU)
+CHRONOS_THREADS = None  # torch CPU threads for inference (None: torch default)
+CHRONOS_CONTEXT_HOURS = 2048  # Same context and horizon as in train_dwd_climate_chronos.py
+CHRONOS_PREDICTION_HOURS = 48
+CHRONOS_REFRESH_INTERVAL = 3600  # Seconds between checks for new hourly observations
+
+# CLIMATOLOGY SETTINGS
+CLIMATE_REFERENCE_PERIOD = (1991, 2020)  # WMO standard reference period for the daily normals
+CLIMATE_PERCENTILES = (10, 90)  # Band drawn around the normal temperature
+CLIMATE_POOL_DAYS = 7  # Normals pool +/- this many neighbouring days of each year
+ROLLING_WINDOWS = (7, 30)  # Trailing rolling means in days
 
 # PV YIELD PREDICTION SETTINGS
 PV_DATA_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vQNLDD7-66luBZ4ijN9n4ruj3EpY1KYLVQUvCCohNZHeKtyKO4VFy_woeE2no7_6Mna5JUqKTr03snq/pub?output=csv"
 PV_TRAINING_DAYS = 90  # Number of recent days used to train the linear regression model
+PV_SHEET_TTL = 600  # Seconds before the PV sheet is downloaded again to check for new rows
 
 # Project Settings
 GITHUB_REPO_URL = "https://github.com/TheRealBob52427/dwd_station_climate_plotter"
@@ -3,39 +3,67 @@ Main application for the DWD Station Climate Plotter.
 Handles web requests, renders templates, and manages GitHub webhooks for auto-deployment.
 """
 import os
-from datetime import datetime
+from datetime import date, datetime
 
-from flask import Flask, render_template, request, jsonify
-import git
+from flask import Flask, render_template, request, jsonify, make_response
 
+import chronos_forecast
 import config
-from weather_logic import get_weather_data, get_forecast_data, enrich_with_pv_data
-from plotting import create_plot
+import metrics
+import response_cache
+import scheduler
+import station_catalog
+from api import api, table_to_columns, HISTORY_FIELDS, CLIMATE_FIELDS, FORECAST_FIELDS
+from weather_logic import (fetch_all, enrich_with_pv_data, refresh_pv_model, data_versions,
+                           history_window, history_level, station_name, fetch_comparison, comparison_pv)
+from plotting import create_plot, create_comparison_plot
 
 app = Flask(__name__)
+app.register_blueprint(api)
+metrics.init_app(app)
+
+_git_hash = {"value": None}
+
+def _read_git_hash():
+    """Reads the checked-out commit straight from .git (HEAD, loose or packed ref) without GitPython."""
+    git_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".git")
+    with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as f_obj:
+        head = f_obj.read().strip()
+    if not head.startswith("ref: "):
+        return head  # Detached HEAD
+    ref = head[5:]
+    try:
+        with open(os.path.join(git_dir, ref), "r", encoding="utf-8") as f_obj:
+            return f_obj.read().strip()
+    except OSError:
+        with open(os.path.join(git_dir, "packed-refs"), "r", encoding="utf-8") as f_obj:
+            for line in f_obj:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split()[0]
+    raise LookupError(ref)
 
 def get_git_hash():
     """
     Retrieves the short Git commit hash of the current version.
-    Returns 'unknown' if the repository cannot be accessed.
+    Uses GIT_HASH from the environment if set (baked into the Docker image at build time),
+    otherwise reads .git on first use. Returns 'unknown' if the repository cannot be accessed.
     """
-    try:
-        repo_path = os.path.dirname(os.path.abspath(__file__))
-        repo = git.Repo(repo_path)
-        return repo.head.object.hexsha[:7]
-    except Exception: # pylint: disable=broad-exception-caught
-        return "unknown"
-
-CURRENT_GIT_HASH = get_git_hash()
+    if _git_hash["value"] is None:
+        try:
+            _git_hash["value"] = (os.environ.get("GIT_HASH") or _read_git_hash())[:7]
+        except Exception: # pylint: disable=broad-exception-caught
+            _git_hash["value"] = "unknown"
+    return _git_hash["value"]
 
 # --- MAIN ROUTE ---
 @app.route('/')
 def index():
-    # 1. Station ID
+    # 1. Station ID (any DWD catalog station, or the one nearest to ?lat=&lon=)
     station_id = request.args.get('station_id', '02667')
-    if station_id not in config.STATIONS:
+    if 'lat' in request.args and 'lon' in request.args:
+        station_id = _nearest_station_id(request.args['lat'], request.args['lon']) or station_id
+    if station_id not in config.STATIONS and station_name(station_id) is None:
         station_id = "02667"
-    station_name = config.STATIONS[station_id]
 
     # 2. Historical Time Range
     try:
@@ -53,45 +81,211 @@ def index():
     except ValueError:
         days_forecast = config.DEFAULT_FORECAST_DAYS
 
-    # 4. Fetch data (Weather, Forecast, and PV Yield)
-    data_rows, summary_or_error = get_weather_data(days_back=days_back, station_id=station_id)
-    forecast_rows = get_forecast_data(station_id, days_ahead=days_forecast)
-    
-    # NEU: PV-Daten in beide Listen (Historie & Forecast) injizieren
-    data_rows, forecast_rows = enrich_with_pv_data(data_rows, forecast_rows)
+    # 4. Serve the rendered page from the response cache (rebuilt when upstream data changes)
+    # Comparisons are built in sorted order, so ?compare=a,b and b,a share one cached page
+    compare_ids = sorted(_parse_compare(request.args.get('compare', '')))
+    with metrics.stage("page"):
+        if compare_ids:
+            page = response_cache.get_page(
+                ("compare", tuple(compare_ids), days_back, days_forecast),
+                build=lambda: _build_comparison_page(compare_ids, days_back, days_forecast),
+                versions_of=lambda: {sid: data_versions(sid) for sid in compare_ids}
+            )
+        else:
+            page = response_cache.get_page(
+                (station_id, days_back, days_forecast),
+                build=lambda: _build_index_page(station_id, days_back, days_forecast),
+                versions_of=lambda: data_versions(station_id),
+                pinned=station_id in config.STATIONS
+            )
+
+    response = make_response(page["body"])
+    if page["etag"]:
+        response.set_etag(page["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+    return response
+
+def _nearest_station_id(lat, lon):
+    """Id of the catalog station closest to lat/lon, or None if the input or catalog is unusable."""
+    try:
+        found = station_catalog.get_catalog().nearest(float(lat), float(lon))
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        print(f"Station Catalog Error: {exc}")
+        return None
+    return found[0][0].station_id if found else None
+
+def _parse_compare(value):
+    """Known station ids of ?compare=a,b,c (duplicates removed, at most COMPARE_MAX_STATIONS)."""
+    station_ids = []
+    for station_id in value.split(','):
+        station_id = station_id.strip()
+        if station_id and station_id not in station_ids and station_name(station_id) is not None:
+            station_ids.append(station_id)
+    return station_ids[:config.COMPARE_MAX_STATIONS]
 
-    # 5. Generate Plot (benötigt jetzt kein drittes Argument mehr)
+def _build_index_page(station_id, days_back, days_forecast):
+    """
+    Fetches all data and renders the dashboard. Returns (html, cacheable); pages with
+    missing upstream data are not cached. Runs without a request context, so the
+    response cache can call it from a background thread.
+    """
+    # 1. Fetch data (Weather, Forecast, and PV sheet concurrently)
+    with metrics.stage("fetch"):
+        history, summary_or_error, forecast, pv_sheet = fetch_all(station_id, days_back, days_forecast)
+    cacheable = history is not None and bool(forecast) and pv_sheet is not None
+
+    # NEU: PV-Daten in beide Tabellen (Historie & Forecast) injizieren
+    with metrics.stage("pv_enrich"):
+        history, forecast = enrich_with_pv_data(history, forecast, pv_sheet)
+
+    # Hourly Chronos forecast: only a cache read, the model runs in the background
+    hourly = chronos_forecast.get_hourly_forecast(station_id)
+
+    # 2. Generate Plot (benötigt jetzt kein drittes Argument mehr)
     plot_json = None
-    if data_rows or forecast_rows:
-        plot_json = create_plot(data_rows, forecast_rows)
+    if history or forecast:
+        with metrics.stage("plot"):
+            plot_json = create_plot(history, forecast, hourly=hourly)
+
+    # Columns for the dashboard script, which then loads further ranges from /api/v1 instead
+    # of reloading the page. Downsampled and monthly plots keep the classic reload.
+    level = history_level(days_back)
+    page_data = None
+    if plot_json and level == "day" and history is not None and len(history) <= config.PLOT_MAX_POINTS:
+        first, last = history_window(days_back)
+        page_data = {
+            "station_id": station_id,
+            "first": date.fromordinal(first).isoformat(),
+            "last": date.fromordinal(last).isoformat(),
+            "history": table_to_columns(history, HISTORY_FIELDS + CLIMATE_FIELDS),
+            "forecast": table_to_columns(forecast, FORECAST_FIELDS),
+            "fc_loaded": days_forecast,
+            "max_points": config.PLOT_MAX_POINTS,
+            "daily_max_days": config.AGGREGATE_ABOVE_DAYS
+        }
+
+    name = station_name(station_id) or station_id
+    current_time_iso = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    with app.app_context(), metrics.stage("render"):
+        html = render_template(
+            'index.html',
+            rows=history,
+            forecast_rows=forecast,
+            summary=summary_or_error,
+            error=summary_or_error if history is None else None,
+            plot_json=plot_json,
+            page_data=page_data,
+            history_level=level,
 
+            # Config
+            stations={**config.STATIONS, station_id: name},
+            current_station=station_id,
+            station_name=name,
+
+            # Selectors
+            time_ranges=config.TIME_RANGES,
+            current_days=days_back,
+            forecast_ranges=config.FORECAST_RANGES,
+            current_fc_days=days_forecast,
+
+            # Metadata
+            last_update=current_time_iso,
+            github_url=config.GITHUB_REPO_URL,
+            app_version=config.APP_VERSION,
+            git_hash=get_git_hash()
+        )
+    return html, cacheable
+
+def _build_comparison_page(station_ids, days_back, days_forecast):
+    """
+    Fetches all compared stations concurrently and renders the overlay chart with one
+    summary per station. Returns (html, cacheable) like _build_index_page.
+    """
+    with metrics.stage("fetch"):
+        history, forecast, summaries, pv_sheet = fetch_comparison(station_ids, days_back, days_forecast)
+    level = history_level(days_back)
+    with metrics.stage("pv_enrich"):
+        history, forecast = comparison_pv(history, forecast, pv_sheet, level)
+    failed = [sid for sid in station_ids if not isinstance(summaries[sid], dict)]
+    cacheable = not failed and len(forecast["dates"]) > 0 and pv_sheet is not None
+
+    names = [(sid, station_name(sid) or sid) for sid in station_ids]
+    with metrics.stage("plot"):
+        plot_json = create_comparison_plot(names, history, forecast)
+    comparison = [{"station_id": sid, "name": name, "summary": summaries[sid]} for sid, name in names]
     current_time_iso = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    return render_template(
-        'index.html',
-        rows=data_rows,
-        forecast_rows=forecast_rows,
-        summary=summary_or_error,
-        error=summary_or_error if data_rows is None else None,
-        plot_json=plot_json,
-
-        # Config
-        stations=config.STATIONS,
-        current_station=station_id,
-        station_name=station_name,
-
-        # Selectors
-        time_ranges=config.TIME_RANGES,
-        current_days=days_back,
-        forecast_ranges=config.FORECAST_RANGES,
-        current_fc_days=days_forecast,
-
-        # Metadata
-        last_update=current_time_iso,
-        github_url=config.GITHUB_REPO_URL,
-        app_version=config.APP_VERSION,
-        git_hash=CURRENT_GIT_HASH
-    )
+    with app.app_context(), metrics.stage("render"):
+        html = render_template(
+            'index.html',
+            rows=None,
+            forecast_rows=None,
+            summary=None,
+            error=summaries[station_ids[0]] if len(failed) == len(station_ids) else None,
+            plot_json=plot_json,
+            page_data=None,
+            history_level=level,
+            comparison=comparison,
+            compare_param=",".join(station_ids),
+
+            # Config
+            stations=dict(names),
+            current_station=None,
+            station_name=" vs. ".join(name for _, name in names),
+
+            # Selectors
+            time_ranges=config.TIME_RANGES,
+            current_days=days_back,
+            forecast_ranges=config.FORECAST_RANGES,
+            current_fc_days=days_forecast,
+
+            # Metadata
+            last_update=current_time_iso,
+            github_url=config.GITHUB_REPO_URL,
+            app_version=config.APP_VERSION,
+            git_hash=get_git_hash()
+        )
+    return html, cacheable
+
+def _warm_all_pages():
+    """Re-renders every cached station/range page whose upstream data changed."""
+    for station_id in config.STATIONS:
+        for days_back in config.TIME_RANGES:
+            for days_forecast in config.FORECAST_RANGES:
+                try:
+                    response_cache.warm(
+                        (station_id, days_back, days_forecast),
+                        build=lambda s=station_id, d=days_back, f=days_forecast: _build_index_page(s, d, f),
+                        versions_of=lambda s=station_id: data_versions(s),
+                        pinned=True
+                    )
+                except Exception as exc: # pylint: disable=broad-exception-caught
+                    print(f"Prefetch Error (page {station_id}/{days_back}/{days_forecast}): {exc}")
+
+def init():
+    """
+    Starts the prefetch scheduler (with PREFETCH_ENABLED) and returns the app. Called by
+    the WSGI entry point, not on import, so scripts and benchmarks get no background threads.
+    """
+    if config.PREFETCH_ENABLED:
+        scheduler.start(warm_pages=_warm_all_pages)
+    return app
+
+# --- PV MODEL REFRESH ---
+@app.route('/refresh_pv_model', methods=['POST'])
+def refresh_pv():
+    """
+    Drops the cached PV sheet and the fitted regression model, so the next page view
+    downloads the sheet again and refits. Protected by the webhook token.
+    """
+    if request.args.get('token') != config.WEBHOOK_SECRET:
+        return jsonify({"message": "Forbidden", "error": "Invalid token"}), 403
+
+    refresh_pv_model()
+    response_cache.clear()
+    return jsonify({"message": "PV model will be refitted on the next request"}), 200
 
 # --- WEBHOOK FOR GITHUB AUTO-DEPLOY ---
 @app.route('/update_server', methods=['POST'])
@@ -105,6 +299,9 @@ def webhook():
         return jsonify({"message": "Forbidden", "error": "Invalid token"}), 403
 
     try:
+        # GitPython is only needed for deployments, not for serving pages
+        import git # pylint: disable=import-outside-toplevel
+
         repo = git.Repo(os.path.dirname(os.path.abspath(__file__)))
         origin = repo.remotes.origin
         pull_info = origin.pull()
@@ -0,0 +1,224 @@
+"""
+Persistent HTTP cache for the DWD Station Climate Plotter.
+Stores upstream files (directory listings, station ZIP archives) on disk and
+revalidates them with ETag/Last-Modified once their TTL has expired.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+import config
+import http_client
+import metrics
+import singleflight
+
+
+class CacheEntry:
+    """A cached upstream file together with its validators."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def etag(self):
+        return self.meta.get("etag")
+
+    @property
+    def last_modified(self):
+        return self.meta.get("last_modified")
+
+    @property
+    def version(self):
+        """Identifier that changes whenever the upstream file changes."""
+        return self.etag or self.last_modified or self.meta.get("sha1")
+
+    def read_bytes(self):
+        with open(self.path, "rb") as f_obj:
+            return f_obj.read()
+
+    def read_text(self, encoding="utf-8"):
+        return self.read_bytes().decode(encoding, errors="replace")
+
+
+def _entry_paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return (os.path.join(config.CACHE_DIR, key + ".bin"),
+            os.path.join(config.CACHE_DIR, key + ".json"))
+
+
+def atomic_write(path, data):
+    """Writes data to path via a temporary file so readers never see partial files."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f_obj:
+            f_obj.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f_obj:
+            return json.load(f_obj)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_meta(meta_path, meta):
+    atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+
+def _touch(path):
+    """Marks an entry as recently used for LRU eviction."""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _evict(max_bytes):
+    """
+    Removes least recently used files until the whole cache tree fits into max_bytes:
+    HTTP entries as well as the derived stores (station stores, statistics, forecasts)
+    other modules keep under CACHE_DIR, which are rebuilt on demand. Lock files and
+    temporary files that are still being written are left alone.
+    """
+    entries = []
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(config.CACHE_DIR):
+        if dir_path == config.CACHE_DIR and "locks" in dir_names:
+            dir_names.remove("locks")
+        for name in file_names:
+            if name.startswith(".tmp_"):
+                continue
+            path = os.path.join(dir_path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        # The metadata of an HTTP entry goes together with its body
+        victims = (path, path[:-4] + ".json") if path.endswith(".bin") else (path,)
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+        total -= size
+
+
+def _fresh_entry(data_path, meta_path, ttl):
+    """Returns (entry or None, meta); entry is set only if the cached copy is younger than ttl."""
+    meta = _load_meta(meta_path)
+    if meta is None or not os.path.exists(data_path):
+        return None, None
+    if time.time() - meta.get("fetched_at", 0) < ttl:
+        _touch(data_path)
+        return CacheEntry(data_path, meta), meta
+    return None, meta
+
+
+def _refresh(url, ttl, data_path, meta_path):
+    # Another thread or worker may have refreshed the entry while we waited for the lock
+    entry, meta = _fresh_entry(data_path, meta_path, ttl)
+    if entry is not None:
+        metrics.inc("cache_lookups_total", cache="http", result="hit")
+        return entry
+    have_entry = meta is not None
+
+    headers = {}
+    if have_entry:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    # The body is streamed into a temporary file next to the entry and renamed into place
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(data_path), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f_obj:
+            response, sha1 = http_client.download(url, f_obj, headers=headers)
+            size = f_obj.tell()
+        if response.status_code == 304 and have_entry:
+            metrics.inc("cache_lookups_total", cache="http", result="revalidated")
+            os.remove(tmp_path)
+            meta["fetched_at"] = time.time()
+            _store_meta(meta_path, meta)
+            _touch(data_path)
+            return CacheEntry(data_path, meta)
+        response.raise_for_status()
+        if response.status_code != 200:
+            # download() only writes the body for 200, anything else would cache an empty file
+            raise requests.HTTPError(f"Unexpected status {response.status_code} for url: {url}",
+                                     response=response)
+        os.replace(tmp_path, data_path)
+    except requests.RequestException as exc:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if have_entry:
+            print(f"Cache: serving stale copy of {url} ({exc})")
+            metrics.inc("cache_lookups_total", cache="http", result="stale")
+            return CacheEntry(data_path, meta)
+        raise
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha1": sha1,
+        "size": size,
+        "fetched_at": time.time()
+    }
+    _store_meta(meta_path, meta)
+    _evict(config.CACHE_MAX_BYTES)
+    metrics.inc("cache_lookups_total", cache="http", result="miss")
+    return CacheEntry(data_path, meta)
+
+
+def fetch(url, ttl):
+    """
+    Returns a CacheEntry for url.
+    Fresh entries (younger than ttl seconds) are served without any network traffic,
+    stale ones are revalidated with a conditional GET. If the upstream server cannot be
+    reached, a stale entry is served rather than failing. Concurrent refreshes of the
+    same url (threads and worker processes) are coalesced into one download.
+    """
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    data_path, meta_path = _entry_paths(url)
+    entry, _ = _fresh_entry(data_path, meta_path, ttl)
+    if entry is not None:
+        metrics.inc("cache_lookups_total", cache="http", result="hit")
+        return entry
+
+    return singleflight.do(
+        ("http_cache", url),
+        lambda: _refresh(url, ttl, data_path, meta_path),
+        across_processes=True
+    )
+
+
+def invalidate(url):
+    """Forgets the cached copy of url, so the next fetch downloads it again."""
+    for path in _entry_paths(url):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
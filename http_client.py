@@ -0,0 +1,103 @@
+"""
+Shared HTTP client for the DWD Station Climate Plotter.
+All upstream downloads (DWD, Open-Meteo, Google Sheets) go through one pooled
+requests.Session with keep-alive, gzip, bounded retries and per-host timeouts.
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import metrics
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_HOSTS,
+        pool_maxsize=config.HTTP_POOL_SIZE_PER_HOST,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "User-Agent": f"dwd_station_climate_plotter/{config.APP_VERSION}"
+    })
+    return session
+
+
+session = _build_session()
+
+
+def _record(host, round_trips, num_bytes, status, duration):
+    with _stats_lock:
+        entry = _stats.setdefault(host, {"requests": 0, "round_trips": 0, "bytes": 0})
+        entry["requests"] += 1
+        entry["round_trips"] += round_trips
+        entry["bytes"] += num_bytes
+    metrics.inc("upstream_requests_total", host=host, status=str(status))
+    metrics.inc("upstream_bytes_total", num_bytes, host=host)
+    metrics.observe("upstream_request_duration_seconds", duration, host=host)
+
+
+def timeout_for(url):
+    """Returns the configured (connect, read) timeout for the host of url."""
+    host = urlsplit(url).hostname
+    read_timeout = config.HTTP_TIMEOUTS.get(host, config.HTTP_DEFAULT_TIMEOUT)
+    return (config.HTTP_CONNECT_TIMEOUT, read_timeout)
+
+
+def get(url, params=None, headers=None, timeout=None):
+    """
+    Performs a GET through the shared session and returns the requests.Response.
+    The body is read completely, so its size can be added to the byte counters.
+    """
+    started = time.perf_counter()
+    response = session.get(url, params=params, headers=headers, timeout=timeout or timeout_for(url))
+    retries = response.raw.retries if response.raw is not None else None
+    round_trips = 1 + (len(retries.history) if retries is not None else 0)
+    _record(urlsplit(url).hostname, round_trips, len(response.content), response.status_code,
+            time.perf_counter() - started)
+    return response
+
+
+def download(url, f_obj, headers=None, timeout=None, chunk_size=64 * 1024):
+    """
+    Streams the body of a GET into the binary file f_obj in chunks instead of holding it in
+    memory. The body is only written for status 200. Returns (response, sha1 hex digest).
+    """
+    digest = hashlib.sha1()
+    num_bytes = 0
+    started = time.perf_counter()
+    with session.get(url, headers=headers, timeout=timeout or timeout_for(url), stream=True) as response:
+        if response.status_code == 200:
+            for chunk in response.iter_content(chunk_size):
+                f_obj.write(chunk)
+                digest.update(chunk)
+                num_bytes += len(chunk)
+        retries = response.raw.retries if response.raw is not None else None
+    round_trips = 1 + (len(retries.history) if retries is not None else 0)
+    _record(urlsplit(url).hostname, round_trips, num_bytes, response.status_code, time.perf_counter() - started)
+    return response, digest.hexdigest()
+
+
+def stats():
+    """Returns a snapshot of the per-host request, round-trip and byte counters."""
+    with _stats_lock:
+        return {host: dict(entry) for host, entry in _stats.items()}
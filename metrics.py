@@ -0,0 +1,206 @@
+"""
+Lightweight instrumentation for the DWD Station Climate Plotter.
+Records stage durations, upstream requests (status, bytes, latency) and cache hits as
+in-process counters and histograms, served in the Prometheus text format at /metrics.
+With SERVER_TIMING_ENABLED the stages of a request are also reported in its
+Server-Timing header. When METRICS_ENABLED is off, every call returns immediately.
+Values are per process; with several worker processes each one is scraped separately.
+"""
+import bisect
+import threading
+import time
+
+import config
+
+PREFIX = "dwd_plotter_"
+
+# name -> (type, help)
+METRICS = {
+    "stage_duration_seconds": ("histogram", "Duration of page building and data fetching stages."),
+    "upstream_requests_total": ("counter", "Upstream HTTP requests by host and status code."),
+    "upstream_bytes_total": ("counter", "Bytes received from upstream hosts."),
+    "upstream_request_duration_seconds": ("histogram", "Duration of upstream HTTP requests."),
+    "cache_lookups_total": ("counter", "Cache lookups by cache and result (hit, miss, revalidated, stale)."),
+    "http_requests_total": ("counter", "Requests served by the app by endpoint and status code."),
+    "http_request_duration_seconds": ("histogram", "Duration of requests served by the app."),
+}
+
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket (non-cumulative)..., sum, count]
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds value to the counter name{labels}."""
+    if not config.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Adds one observation to the histogram name{labels}."""
+    if not config.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    buckets = config.METRICS_BUCKETS
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [0] * (len(buckets) + 2)
+        if index < len(buckets):
+            entry[index] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started
+        observe("stage_duration_seconds", duration, stage=self.name)
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings.append((self.name, duration))
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Context manager timing one stage (histogram stage_duration_seconds{stage=name})."""
+    if not config.METRICS_ENABLED:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def bind(fn):
+    """
+    Wraps fn so stages it runs on another thread (e.g. the fetch pool) are also reported
+    in the Server-Timing header of the request that submitted it.
+    """
+    timings = getattr(_local, "timings", None)
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, "timings", None)
+        _local.timings = timings
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.timings = previous
+    return run
+
+
+def _server_timing(timings):
+    # Stages that ran several times (e.g. per station) are summed
+    totals = {}
+    for name, seconds in list(timings):
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(entry) for key, entry in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+            continue
+        for (metric, labels), entry in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(config.METRICS_BUCKETS, entry):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {entry[-2]}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {entry[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Drops all recorded values."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def init_app(app):
+    """Registers the request hooks and the /metrics endpoint on a Flask app."""
+    from flask import Response, g, request  # pylint: disable=import-outside-toplevel
+
+    @app.before_request
+    def start_request():
+        g.metrics_started = time.perf_counter()
+        _local.timings = [] if config.METRICS_ENABLED and config.SERVER_TIMING_ENABLED else None
+
+    @app.after_request
+    def finish_request(response):
+        timings, _local.timings = getattr(_local, "timings", None), None
+        if not config.METRICS_ENABLED:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        if endpoint != "/metrics":
+            duration = time.perf_counter() - g.get("metrics_started", time.perf_counter())
+            inc("http_requests_total", endpoint=endpoint, status=str(response.status_code))
+            observe("http_request_duration_seconds", duration, endpoint=endpoint)
+        if timings:
+            response.headers["Server-Timing"] = _server_timing(timings)
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if not config.METRICS_ENABLED:
+            return Response("Metrics are disabled\n", status=404, mimetype="text/plain")
+        if config.METRICS_TOKEN and request.args.get('token') != config.METRICS_TOKEN:
+            return Response("Forbidden\n", status=403, mimetype="text/plain")
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -1,71 +1,352 @@
 """
 Plotting module for the DWD Station Climate Plotter.
 Generates interactive Plotly charts for weather data and PV yield visualization.
+The figure JSON is assembled directly from column arrays (no plotly figure object),
+with a cached static layout and optional downsampling for long windows.
 """
 import json
-import plotly
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
 
-def create_plot(historical_rows, forecast_rows=None):
-    if not historical_rows and not forecast_rows:
+import numpy as np
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SUBPLOT_TITLES = ("Temperature Trend (°C)", "Rain (mm) & Sun (h)", "PV Yield (kWh) - Actual vs. Predicted")
+
+# Rows 1..3 of a 3x1 subplot grid with vertical_spacing=0.08 (same as make_subplots)
+_ROW_DOMAINS = ([0.72, 1.0], [0.36, 0.64], [0.0, 0.28])
+
+_AXIS_STYLE = {
+    "showgrid": True, "gridwidth": 1, "gridcolor": "#e5e5e5",
+    "linecolor": "white", "ticks": "", "zerolinecolor": "white", "zerolinewidth": 2,
+    "automargin": True, "title": {"standoff": 15}
+}
+_BAR_OUTLINE = {"color": "#E5ECF6", "width": 0.5}
+
+# One colour per station in comparison views (Plotly's default qualitative palette)
+COMPARE_COLORS = ("#636efa", "#ef553b", "#00cc96", "#ab63fa", "#ffa15a",
+                  "#19d3f3", "#ff6692", "#b6e880", "#ff97ff", "#fecb52")
+
+
+def _build_static_layout():
+    layout = {
+        "height": 950, "barmode": "group", "showlegend": True,
+        "margin": {"l": 50, "r": 50, "t": 60, "b": 50},
+        "plot_bgcolor": "rgba(0,0,0,0)", "paper_bgcolor": "rgba(0,0,0,0)",
+        "hovermode": "x unified", "hoverlabel": {"align": "left"},
+        "font": {"color": "#2a3f5f"}
+    }
+    for row, domain in enumerate(_ROW_DOMAINS, start=1):
+        suffix = "" if row == 1 else str(row)
+        xaxis = {"anchor": f"y{suffix}", "domain": [0.0, 1.0], **_AXIS_STYLE}
+        if row < len(_ROW_DOMAINS):
+            xaxis.update(matches="x3", showticklabels=False)
+        layout[f"xaxis{suffix}"] = xaxis
+        layout[f"yaxis{suffix}"] = {"anchor": f"x{suffix}", "domain": domain, **_AXIS_STYLE}
+    return layout
+
+
+_STATIC_LAYOUT = _build_static_layout()
+_TITLE_ANNOTATIONS = [
+    {"font": {"size": 16}, "showarrow": False, "text": title, "x": 0.5, "xanchor": "center",
+     "xref": "paper", "y": domain[1], "yanchor": "bottom", "yref": "paper"}
+    for title, domain in zip(SUBPLOT_TITLES, _ROW_DOMAINS)
+]
+
+
+def dumps(obj):
+    """Compact JSON encoding (orjson if installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def to_list(values):
+    """Converts a float array into a JSON-ready list with None for NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    return [None if v != v else v for v in values.tolist()]
+
+
+def iso_dates(ordinals):
+    """Converts date ordinals into 'YYYY-MM-DD' strings."""
+    return np.datetime_as_string((np.asarray(ordinals, dtype=np.int64) - 719163).astype("datetime64[D]")).tolist()
+
+
+def _lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the kept points."""
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if threshold >= n or threshold < 3:
+        return valid
+    xs, ys = x[valid].astype(np.float64), y[valid]
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = xs[end:next_end].mean(), ys[end:next_end].mean()
+        area = np.abs((xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def _bucket_max(x, columns, buckets):
+    """Peak-preserving decimation for bar series: per-bucket maximum, dated at the bucket start."""
+    starts = np.linspace(0, len(x), buckets, endpoint=False).astype(np.int64)
+    reduced = []
+    for values in columns:
+        with np.errstate(invalid="ignore"):
+            reduced.append(np.fmax.reduceat(values, starts))
+    return x[starts], reduced
+
+
+def _columns(table):
+    """Date ordinals and value columns of a WeatherTable (empty arrays for None)."""
+    if table is None:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty, empty, empty
+    return (table.dates, table.display_column('temp'), np.nan_to_num(table.display_column('rain')),
+            np.nan_to_num(table.display_column('sun')), table.display_column('pv_actual'),
+            table.display_column('pv_predicted'))
+
+
+def _binding(source, column, zero_fill=False, decimated=False, custom=None):
+    """
+    Trace metadata that tells the dashboard script which data column a trace shows
+    (and which one feeds its customdata), so it can rebind x/y after loading another
+    date range without a page reload.
+    """
+    meta = {"source": source, "column": column}
+    if zero_fill:
+        meta["zero_fill"] = True
+    if decimated:
+        meta["decimated"] = True
+    if custom:
+        meta["custom"] = custom
+    return meta
+
+
+def _climate_columns(table, names):
+    """Extracts climate_stats columns from a WeatherTable (None if it has none)."""
+    if table is None or not table.has_column("temp_normal"):
         return None
+    return {name: table.display_column(name) for name in names}
+
+
+def _scatter(x, y, axis, **attrs):
+    return {"type": "scatter", "x": x, "y": y, "xaxis": f"x{axis}", "yaxis": f"y{axis}", **attrs}
+
+
+def _bar(x, y, axis, color, **attrs):
+    return {"type": "bar", "x": x, "y": y, "xaxis": f"x{axis}", "yaxis": f"y{axis}",
+            "marker": {"color": color, "line": _BAR_OUTLINE}, **attrs}
 
-    hist_data = historical_rows[::-1] if historical_rows else []
-    fore_data = forecast_rows if forecast_rows else []
 
-    def get_cols(data):
-        return (
-            [r['date_obj'] for r in data],
-            [r.get('temp') for r in data],
-            [r.get('rain') or 0 for r in data],
-            [r.get('sun') or 0 for r in data],
-            [r.get('pv_actual') for r in data],    # Neue PV-Spalten
-            [r.get('pv_predicted') for r in data]
-        )
+def _quantile_band(x, hourly, column, axis, name, color, fillcolor, visible=True):
+    """P10-P90 band and median line of one hourly Chronos variate, toggled together in the legend."""
+    group = {"legendgroup": f"chronos_{column}", "meta": _binding("chronos", column)}
+    if visible is not True:
+        group["visible"] = visible
+    return [
+        _scatter(x, to_list(hourly[f"{column}_q10"]), axis, name=f'{name} P10', mode='lines',
+                 line={"width": 0}, showlegend=False, hoverinfo='skip', **group),
+        _scatter(x, to_list(hourly[f"{column}_q90"]), axis, name=f'{name} (P10-P90)', mode='lines',
+                 line={"width": 0}, fill='tonexty', fillcolor=fillcolor, hoverinfo='skip', showlegend=False, **group),
+        _scatter(x, to_list(hourly[f"{column}_q50"]), axis, name=name, mode='lines',
+                 line={"color": color, "width": 1.5}, **group)
+    ]
 
-    h_dates, h_temps, h_rains, h_suns, h_pv_actual, h_pv_pred = get_cols(hist_data)
-    f_dates, f_temps, f_rains, f_suns, f_pv_actual, f_pv_pred = get_cols(fore_data)
 
-    fig = make_subplots(
-        rows=3, cols=1, 
-        shared_xaxes=True, vertical_spacing=0.08,
-        subplot_titles=("Temperature Trend (°C)", "Rain (mm) & Sun (h)", "PV Yield (kWh) - Actual vs. Predicted")
-    )
+def create_plot(history, forecast=None, max_points=None, hourly=None):
+    """
+    Returns the Plotly figure JSON (data + layout) for the dashboard from the history and
+    forecast WeatherTables (as returned by get_weather_data / get_forecast_data). A history
+    carrying climate_stats columns adds the normal range, normals and rolling means as extra
+    traces and the anomalies to the hover labels. hourly is an optional Chronos forecast
+    (see chronos_forecast.get_hourly_forecast) drawn as median lines with P10-P90 bands;
+    the dashboard script leaves these traces as they are on range changes. If the history is
+    longer than max_points (default config.PLOT_MAX_POINTS), the temperature line is
+    downsampled with LTTB and the bar series with per-bucket maxima.
+    """
+    if not history and not forecast and hourly is None:
+        return None
+
+    max_points = max_points or config.PLOT_MAX_POINTS
+    h_dates, h_temps, h_rains, h_suns, h_pv_actual, h_pv_pred = _columns(history)
+    f_dates, f_temps, f_rains, f_suns, _, f_pv_pred = _columns(forecast)
+
+    traces = []
+    has_hist, has_fcst = len(h_dates) > 0, len(f_dates) > 0
+    h_iso, f_iso = iso_dates(h_dates), iso_dates(f_dates)
+    climate = _climate_columns(history, (
+        "temp_normal", "temp_normal_p10", "temp_normal_p90", "temp_mean_7", "temp_mean_30", "temp_anomaly",
+        "rain_normal", "rain_mean_30", "rain_anomaly", "sun_normal", "sun_mean_30", "sun_anomaly"))
 
     # --- TOP PLOT: TEMPERATURE  ---
-    if h_dates:
-        fig.add_trace(go.Scatter(x=h_dates, y=h_temps, name='Temp (Hist)', mode='lines', line=dict(color='#d9534f', width=3)), row=1, col=1)
-    if f_dates:
-        if h_dates and h_temps[-1] is not None and f_temps[0] is not None:
-            fig.add_trace(go.Scatter(x=[h_dates[-1], f_dates[0]], y=[h_temps[-1], f_temps[0]], showlegend=False, mode='lines', line=dict(color='#d9534f', dash='dot', width=2), hoverinfo='skip'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=f_dates, y=f_temps, name='Temp (Fcst)', mode='lines+markers', line=dict(color='#d9534f', dash='dot', width=2), marker=dict(size=6)), row=1, col=1)
+    decimated = has_hist and len(h_dates) > max_points
+    if has_hist:
+        keep = _lttb(h_dates, h_temps, max_points) if decimated else slice(None)
+        temp_x, temp_y = (iso_dates(h_dates[keep]), to_list(h_temps[keep])) if decimated else (h_iso, to_list(h_temps))
+        if climate is not None:
+            # Normal range first, so it is drawn below the measured temperature
+            traces.append(_scatter(temp_x, to_list(climate["temp_normal_p10"][keep]), "", name='Normal P10',
+                                   mode='lines', line={"width": 0}, showlegend=False, hoverinfo='skip',
+                                   meta=_binding("history", "temp_normal_p10", decimated=decimated)))
+            traces.append(_scatter(temp_x, to_list(climate["temp_normal_p90"][keep]), "", name='Normal Range (P10-P90)',
+                                   mode='lines', line={"width": 0}, fill='tonexty', fillcolor='rgba(128,128,128,0.15)',
+                                   hoverinfo='skip', meta=_binding("history", "temp_normal_p90", decimated=decimated)))
+            traces.append(_scatter(temp_x, to_list(climate["temp_normal"][keep]), "", name='Temp (Normal)', mode='lines',
+                                   line={"color": 'gray', "dash": 'dash', "width": 1},
+                                   meta=_binding("history", "temp_normal", decimated=decimated)))
+        temp_attrs = {}
+        if climate is not None:
+            temp_attrs = {"customdata": to_list(climate["temp_anomaly"][keep]),
+                          "hovertemplate": "%{y:.1f} °C (%{customdata:+.1f} vs. normal)"}
+        traces.append(_scatter(temp_x, temp_y, "", name='Temp (Hist)', mode='lines',
+                               line={"color": '#d9534f', "width": 3},
+                               meta=_binding("history", "temp", decimated=decimated, custom="temp_anomaly"
+                                             if climate is not None else None), **temp_attrs))
+        if climate is not None:
+            traces.append(_scatter(temp_x, to_list(climate["temp_mean_7"][keep]), "", name='Temp (7-day Mean)',
+                                   mode='lines', line={"color": '#8e44ad', "width": 1.5}, visible='legendonly',
+                                   meta=_binding("history", "temp_mean_7", decimated=decimated)))
+            traces.append(_scatter(temp_x, to_list(climate["temp_mean_30"][keep]), "", name='Temp (30-day Mean)',
+                                   mode='lines', line={"color": '#2c3e50', "width": 2},
+                                   meta=_binding("history", "temp_mean_30", decimated=decimated)))
+    if has_fcst:
+        if has_hist and not np.isnan(h_temps[-1]) and not np.isnan(f_temps[0]):
+            traces.append(_scatter([h_iso[-1], f_iso[0]], [float(h_temps[-1]), float(f_temps[0])], "",
+                                   showlegend=False, mode='lines', hoverinfo='skip',
+                                   line={"color": '#d9534f', "dash": 'dot', "width": 2},
+                                   meta=_binding("bridge", "temp")))
+        traces.append(_scatter(f_iso, to_list(f_temps), "", name='Temp (Fcst)', mode='lines+markers',
+                               line={"color": '#d9534f', "dash": 'dot', "width": 2}, marker={"size": 6},
+                               meta=_binding("forecast", "temp")))
+    if hourly is not None:
+        traces.extend(_quantile_band(hourly["times"], hourly, "temp", "", 'Temp (Chronos, hourly)',
+                                     '#6f42c1', 'rgba(111,66,193,0.15)'))
+
+    # Bars are decimated together so the subplots stay aligned
+    if decimated:
+        bar_dates, (b_rains, b_suns, b_pv_actual, b_pv_pred) = _bucket_max(
+            h_dates, (h_rains, h_suns, h_pv_actual, h_pv_pred), max_points)
+        bar_x = iso_dates(bar_dates)
+    else:
+        bar_x, b_rains, b_suns, b_pv_actual, b_pv_pred = h_iso, h_rains, h_suns, h_pv_actual, h_pv_pred
 
     # --- MIDDLE PLOT: RAIN & SUN  ---
-    if h_dates:
-        fig.add_trace(go.Bar(x=h_dates, y=h_rains, name='Rain', marker_color='#0275d8'), row=2, col=1)
-        fig.add_trace(go.Bar(x=h_dates, y=h_suns, name='Sun', marker_color='#f0ad4e'), row=2, col=1)
-    if f_dates:
-        fig.add_trace(go.Bar(x=f_dates, y=f_rains, name='Rain (Fcst)', marker_color='#0275d8', opacity=0.4, showlegend=False), row=2, col=1)
-        fig.add_trace(go.Bar(x=f_dates, y=f_suns, name='Sun (Fcst)', marker_color='#f0ad4e', opacity=0.4, showlegend=False), row=2, col=1)
+    if has_hist:
+        bar_attrs = {"rain": {}, "sun": {}}
+        if climate is not None and not decimated:
+            for column, unit in (("rain", "mm"), ("sun", "h")):
+                bar_attrs[column] = {"customdata": to_list(climate[f"{column}_anomaly"]),
+                                     "hovertemplate": f"%{{y:.1f}} {unit} (%{{customdata:+.1f}} vs. normal)"}
+        traces.append(_bar(bar_x, to_list(b_rains), 2, '#0275d8', name='Rain',
+                           meta=_binding("history", "rain", zero_fill=True, decimated=decimated,
+                                         custom="rain_anomaly" if bar_attrs["rain"] else None), **bar_attrs["rain"]))
+        traces.append(_bar(bar_x, to_list(b_suns), 2, '#f0ad4e', name='Sun',
+                           meta=_binding("history", "sun", zero_fill=True, decimated=decimated,
+                                         custom="sun_anomaly" if bar_attrs["sun"] else None), **bar_attrs["sun"]))
+        if climate is not None:
+            for column, color in (("rain", '#0275d8'), ("sun", '#f0ad4e')):
+                traces.append(_scatter(temp_x, to_list(climate[f"{column}_normal"][keep]), 2,
+                                       name=f'{column.capitalize()} (Normal)', mode='lines',
+                                       line={"color": color, "dash": 'dash', "width": 1},
+                                       meta=_binding("history", f"{column}_normal", decimated=decimated)))
+                traces.append(_scatter(temp_x, to_list(climate[f"{column}_mean_30"][keep]), 2,
+                                       name=f'{column.capitalize()} (30-day Mean)', mode='lines',
+                                       line={"color": color, "width": 2}, visible='legendonly',
+                                       meta=_binding("history", f"{column}_mean_30", decimated=decimated)))
+    if has_fcst:
+        traces.append(_bar(f_iso, to_list(f_rains), 2, '#0275d8', name='Rain (Fcst)', opacity=0.4, showlegend=False,
+                           meta=_binding("forecast", "rain", zero_fill=True)))
+        traces.append(_bar(f_iso, to_list(f_suns), 2, '#f0ad4e', name='Sun (Fcst)', opacity=0.4, showlegend=False,
+                           meta=_binding("forecast", "sun", zero_fill=True)))
+    if hourly is not None:
+        traces.extend(_quantile_band(hourly["times"], hourly, "rain", 2, 'Rain (Chronos, hourly)',
+                                     '#0275d8', 'rgba(2,117,216,0.15)', visible='legendonly'))
+        traces.extend(_quantile_band(hourly["times"], hourly, "sun", 2, 'Sun (Chronos, hourly)',
+                                     '#f0ad4e', 'rgba(240,173,78,0.15)', visible='legendonly'))
 
     # --- BOTTOM PLOT: PV YIELD ---
-    if h_dates:
-        fig.add_trace(go.Bar(x=h_dates, y=h_pv_actual, name='PV Actual (Hist)', marker_color='#5cb85c'), row=3, col=1)
-        fig.add_trace(go.Bar(x=h_dates, y=h_pv_pred, name='PV Predicted (Hist)', marker_color='#5bc0de'), row=3, col=1)
-        
-    if f_dates:
+    if has_hist:
+        traces.append(_bar(bar_x, to_list(b_pv_actual), 3, '#5cb85c', name='PV Actual (Hist)',
+                           meta=_binding("history", "pv_actual", decimated=decimated)))
+        traces.append(_bar(bar_x, to_list(b_pv_pred), 3, '#5bc0de', name='PV Predicted (Hist)',
+                           meta=_binding("history", "pv_predicted", decimated=decimated)))
+    if has_fcst:
         # Forecast PV Yield wird halbtransparent gezeichnet
-        fig.add_trace(go.Bar(x=f_dates, y=f_pv_pred, name='PV Predicted (Fcst)', marker_color='#5bc0de', opacity=0.4), row=3, col=1)
+        traces.append(_bar(f_iso, to_list(f_pv_pred), 3, '#5bc0de', name='PV Predicted (Fcst)', opacity=0.4,
+                           meta=_binding("forecast", "pv_predicted")))
+
+    return dumps({"data": traces, "layout": _layout(f_iso[0] if has_fcst else None)})
+
+
+def _layout(forecast_start=None):
+    """Static layout plus a 'Forecast Start' line in every subplot."""
+    layout = dict(_STATIC_LAYOUT)
+    layout["annotations"] = list(_TITLE_ANNOTATIONS)
+    if forecast_start is not None:
+        layout["shapes"] = []
+        for suffix in ("", "2", "3"):
+            layout["shapes"].append({
+                "type": "line", "line": {"color": "gray", "dash": "dash", "width": 1},
+                "x0": forecast_start, "x1": forecast_start, "xref": f"x{suffix}",
+                "y0": 0, "y1": 1, "yref": f"y{suffix} domain"
+            })
+            layout["annotations"].append({
+                "showarrow": False, "text": "Forecast Start", "x": forecast_start, "xanchor": "right",
+                "xref": f"x{suffix}", "y": 1, "yanchor": "top", "yref": f"y{suffix} domain"
+            })
+    return layout
+
+
+def create_comparison_plot(stations, history, forecast):
+    """
+    Returns the Plotly figure JSON overlaying several stations in the dashboard subplots.
+    stations is a list of (station_id, name); history and forecast are joined columns
+    (see weather_logic.join_columns) with one matrix row per station, plus the optional
+    pv_predicted matrices and pv_actual row of weather_logic.comparison_pv. Each station
+    keeps one colour and one legend group across all subplots.
+    """
+    h_iso, f_iso = iso_dates(history["dates"]), iso_dates(forecast["dates"])
+    if not h_iso and not f_iso:
+        return None
 
-    fig.update_layout(
-        height=950, barmode='group', showlegend=True,
-        margin=dict(l=50, r=50, t=60, b=50), plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', hovermode="x unified"
-    )
-    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='#e5e5e5')
-    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#e5e5e5')
+    traces = []
+    for i, (station_id, name) in enumerate(stations):
+        color = COMPARE_COLORS[i % len(COMPARE_COLORS)]
+        group = {"legendgroup": station_id}
+        if h_iso:
+            traces.append(_scatter(h_iso, to_list(history["temp"][i]), "", name=name, mode='lines',
+                                   line={"color": color, "width": 2}, **group))
+            traces.append(_bar(h_iso, to_list(np.nan_to_num(history["rain"][i])), 2, color,
+                               name=f'{name} Rain', showlegend=False, **group))
+            traces.append(_scatter(h_iso, to_list(history["sun"][i]), 2, name=f'{name} Sun', mode='lines',
+                                   line={"color": color, "dash": 'dot', "width": 1.5}, showlegend=False, **group))
+            if "pv_predicted" in history:
+                traces.append(_scatter(h_iso, to_list(history["pv_predicted"][i]), 3, name=f'{name} PV Predicted',
+                                       mode='lines', line={"color": color, "width": 1.5}, showlegend=False, **group))
+        if f_iso:
+            traces.append(_scatter(f_iso, to_list(forecast["temp"][i]), "", name=f'{name} (Fcst)',
+                                   mode='lines+markers', line={"color": color, "dash": 'dot', "width": 2},
+                                   marker={"size": 5}, showlegend=not h_iso, **group))
+            traces.append(_bar(f_iso, to_list(np.nan_to_num(forecast["rain"][i])), 2, color,
+                               name=f'{name} Rain (Fcst)', opacity=0.4, showlegend=False, **group))
+            if "pv_predicted" in forecast:
+                traces.append(_scatter(f_iso, to_list(forecast["pv_predicted"][i]), 3,
+                                       name=f'{name} PV Predicted (Fcst)', mode='lines',
+                                       line={"color": color, "dash": 'dot', "width": 1.5}, showlegend=False, **group))
 
-    if f_dates:
-        fig.add_vline(x=f_dates[0].timestamp() * 1000, line_width=1, line_dash="dash", line_color="gray", annotation_text="Forecast Start", annotation_position="top left")
+    if h_iso and "pv_actual" in history and not np.all(np.isnan(history["pv_actual"])):
+        traces.append(_bar(h_iso, to_list(history["pv_actual"]), 3, '#5cb85c', name='PV Actual', opacity=0.6))
 
-    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
\ No newline at end of file
+    return dumps({"data": traces, "layout": _layout(f_iso[0] if f_iso else None)})
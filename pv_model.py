@@ -0,0 +1,183 @@
+"""
+PV yield model registry for the DWD Station Climate Plotter.
+Fits the linear regression only when the PV sheet (or the training window) changes and
+keeps the fitted coefficients in memory and on disk for all later requests. The sheet
+itself is held as NumPy columns (PVSheet), so serving pages needs neither pandas nor
+scikit-learn; the latter is only imported for a refit.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+import http_cache
+import metrics
+
+PV_FEATURES = ['TagImJahr', 'Temperatur (°C)', 'Niederschlag (mm)', 'Sonnenstunden (h)']
+PV_TARGET = 'PV-Ertrag (kWh)'
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+_current = {"model": None}
+_lock = threading.Lock()
+
+
+class PVSheet:
+    """
+    The PV sheet as parallel columns: "days" (date ordinals, 0 where the date is invalid)
+    plus one float64 column per sheet column in PV_FEATURES + [PV_TARGET] (NaN for empty
+    or non-numeric cells). content_hash identifies the downloaded sheet.
+    """
+
+    def __init__(self, days, columns, content_hash=None):
+        self.days = np.asarray(days, dtype=np.int64)
+        self.columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.content_hash = content_hash
+
+    def __len__(self):
+        return len(self.days)
+
+    def column(self, name):
+        """Column name as a float64 array (all NaN if the sheet has no such column)."""
+        values = self.columns.get(name)
+        return values if values is not None else np.full(len(self), np.nan)
+
+
+class PVModel:
+    """Coefficients of a fitted linear regression y = X @ coef + intercept."""
+
+    def __init__(self, key, coef, intercept, trained_rows):
+        self.key = key
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.trained_rows = trained_rows
+
+    def predict(self, features):
+        """Predicts the PV yield for a 2D array of PV_FEATURES rows."""
+        return np.asarray(features, dtype=np.float64) @ self.coef + self.intercept
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "features": PV_FEATURES,
+            "coef": self.coef.tolist(),
+            "intercept": self.intercept,
+            "trained_rows": self.trained_rows
+        }
+
+
+def _model_path():
+    return os.path.join(config.CACHE_DIR, "pv_model.json")
+
+
+def _load(key):
+    try:
+        with open(_model_path(), "r", encoding="utf-8") as f_obj:
+            data = json.load(f_obj)
+    except (OSError, ValueError):
+        return None
+    if data.get("key") != key or data.get("features") != PV_FEATURES:
+        return None
+    return PVModel(key, data["coef"], data["intercept"], data["trained_rows"])
+
+
+def _save(model):
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    http_cache.atomic_write(_model_path(), json.dumps(model.to_dict()).encode("utf-8"))
+
+
+def _fit(key, pv_sheet, cutoff_train_date):
+    # Imported on the first fit only, so starting a worker does not pay for scikit-learn
+    from sklearn.linear_model import LinearRegression # pylint: disable=import-outside-toplevel
+
+    features = np.column_stack([pv_sheet.column(name) for name in PV_FEATURES])
+    target = pv_sheet.column(PV_TARGET)
+    train = ~np.isnan(features).any(axis=1) & ~np.isnan(target) & (pv_sheet.days > cutoff_train_date.toordinal())
+    if not train.any():
+        return None
+
+    regression = LinearRegression()
+    regression.fit(features[train], target[train])
+    return PVModel(key, regression.coef_, regression.intercept_, int(train.sum()))
+
+
+def get_model(pv_sheet):
+    """
+    Returns the PVModel for the given sheet (see weather_logic.fetch_pv_sheet), or None if
+    there is not enough training data. The model is keyed by the sheet's content hash and
+    the start of the training window, so it is refitted only when a row is added to the
+    sheet or the window moves on to the next day.
+    """
+    cutoff = (datetime.now() - timedelta(days=config.PV_TRAINING_DAYS)).date()
+    key = f"{pv_sheet.content_hash or ''}:{cutoff.isoformat()}"
+
+    with _lock:
+        model = _current["model"]
+        if model is not None and model.key == key:
+            return model
+
+        model = _load(key)
+        if model is None:
+            with metrics.stage("pv_model_fit"):
+                model = _fit(key, pv_sheet, cutoff)
+            if model is not None:
+                _save(model)
+        _current["model"] = model
+        return model
+
+
+def day_of_year(ordinals):
+    """Vectorized day of year (1..366) for an array of date ordinals."""
+    days = (np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype('datetime64[D]')
+    return (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+
+
+def predict_batch(model, ordinals, temp, rain, sun):
+    """
+    Predicts the PV yield for all days at once. Missing rain/sun count as 0, days without
+    a temperature get NaN, and negative predictions are clipped to 0.
+    """
+    temp = np.asarray(temp, dtype=np.float64)
+    features = np.column_stack((
+        day_of_year(ordinals),
+        temp,
+        np.nan_to_num(np.asarray(rain, dtype=np.float64)),
+        np.nan_to_num(np.asarray(sun, dtype=np.float64))
+    ))
+    predicted = np.maximum(model.predict(features), 0.0)
+    predicted[np.isnan(temp)] = np.nan
+    return predicted
+
+
+def actual_yield(pv_sheet, ordinals):
+    """Looks up the recorded PV yield for each date ordinal (NaN where the sheet has none)."""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    values = pv_sheet.column(PV_TARGET)
+    valid = (pv_sheet.days > 0) & ~np.isnan(values)
+
+    # Sorted by day; of several rows for the same day the last one in the sheet wins
+    order = np.argsort(pv_sheet.days[valid], kind="stable")
+    sheet_ordinals, sheet_values = pv_sheet.days[valid][order], values[valid][order]
+    last_of_day = np.append(sheet_ordinals[1:] != sheet_ordinals[:-1], True)
+    sheet_ordinals, sheet_values = sheet_ordinals[last_of_day], sheet_values[last_of_day]
+    result = np.full(len(ordinals), np.nan)
+    if len(sheet_ordinals) == 0:
+        return result
+
+    idx = np.minimum(np.searchsorted(sheet_ordinals, ordinals), len(sheet_ordinals) - 1)
+    found = sheet_ordinals[idx] == ordinals
+    result[found] = sheet_values[idx[found]]
+    return result
+
+
+def refresh():
+    """Drops the fitted model from memory and disk; the next request refits it."""
+    with _lock:
+        _current["model"] = None
+        try:
+            os.remove(_model_path())
+        except OSError:
+            pass
@@ -0,0 +1,144 @@
+"""
+Rendered-response cache for the DWD Station Climate Plotter.
+Keeps the finished dashboard HTML per (station, days, fc_days) in memory and invalidates
+an entry as soon as one of the upstream data versions it was built from changes.
+Pages of the configured stations are always kept; all other pages (catalog stations,
+comparisons) share the room left under RESPONSE_CACHE_MAX_ENTRIES, least recently used first out.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import metrics
+import singleflight
+
+_entries = OrderedDict()
+_refreshing = set()
+_lock = threading.Lock()
+
+
+def _make_entry(key, body, versions, pinned):
+    tag_source = repr((key, sorted(versions.items()), config.APP_VERSION)).encode("utf-8")
+    return {
+        "body": body,
+        "etag": hashlib.sha1(tag_source + body.encode("utf-8")).hexdigest(),
+        "versions": versions,
+        "checked_at": time.monotonic(),
+        "pinned": pinned
+    }
+
+
+def _store(key, entry):
+    """Stores entry and evicts the least recently used unpinned pages beyond the size limit (call with _lock held)."""
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    excess = len(_entries) - config.RESPONSE_CACHE_MAX_ENTRIES
+    if excess > 0:
+        for old_key in [k for k, e in _entries.items() if not e["pinned"]][:excess]:
+            del _entries[old_key]
+
+
+def _lookup(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+    return entry
+
+
+def _build_and_store(key, build, versions_of, pinned=False):
+    """
+    Runs build() -> (body, cacheable) and stores the result if it is cacheable.
+    The versions are read before rendering: if upstream data changes meanwhile, the page
+    is tagged with the older versions and rebuilt on the next check.
+    """
+    try:
+        versions = versions_of()
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        print(f"Response Cache: could not determine data versions ({exc})")
+        versions = None
+    body, cacheable = build()
+    entry = {"body": body, "etag": None}
+    if cacheable and versions is not None:
+        entry = _make_entry(key, body, versions, pinned)
+        with _lock:
+            _store(key, entry)
+    return entry
+
+
+def _refresh_in_background(key, build, versions_of, pinned):
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _build_and_store(key, build, versions_of, pinned)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Response Cache: background refresh of {key} failed ({exc})")
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name=f"refresh-{key}", daemon=True).start()
+
+
+def get_page(key, build, versions_of, pinned=False):
+    """
+    Returns {"body", "etag"} for key.
+    build() renders the page and returns (body, cacheable); versions_of() returns a dict of
+    the current upstream data versions. A cached entry is served as long as its versions
+    match; they are re-checked at most every RESPONSE_CACHE_CHECK_INTERVAL seconds.
+    With RESPONSE_CACHE_STALE_WHILE_REVALIDATE the outdated page is served while a
+    background thread renders the new one; otherwise concurrent requests for a missing or
+    outdated page share one rendering. "etag" is None for uncacheable pages. pinned pages
+    (configured stations) are never evicted.
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        body, _ = build()
+        return {"body": body, "etag": None}
+
+    entry = _lookup(key)
+    if entry is not None:
+        if time.monotonic() - entry["checked_at"] < config.RESPONSE_CACHE_CHECK_INTERVAL:
+            metrics.inc("cache_lookups_total", cache="response", result="hit")
+            return entry
+        try:
+            with metrics.stage("version_check"):
+                current = versions_of()
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Response Cache: version check failed, serving cached page ({exc})")
+            metrics.inc("cache_lookups_total", cache="response", result="stale")
+            return entry
+        if current == entry["versions"]:
+            entry["checked_at"] = time.monotonic()
+            metrics.inc("cache_lookups_total", cache="response", result="revalidated")
+            return entry
+        if config.RESPONSE_CACHE_STALE_WHILE_REVALIDATE:
+            _refresh_in_background(key, build, versions_of, pinned)
+            metrics.inc("cache_lookups_total", cache="response", result="stale")
+            return entry
+
+    metrics.inc("cache_lookups_total", cache="response", result="miss")
+    return singleflight.do(("page", key), lambda: _build_and_store(key, build, versions_of, pinned))
+
+
+def warm(key, build, versions_of, pinned=False):
+    """
+    Makes sure the cached page for key matches the current data versions, rendering it
+    in the calling thread if it is missing or outdated. Used by the prefetch scheduler.
+    """
+    entry = _lookup(key)
+    if entry is not None and versions_of() == entry["versions"]:
+        entry["checked_at"] = time.monotonic()
+        return
+    _build_and_store(key, build, versions_of, pinned)
+
+
+def clear():
+    """Drops all cached pages."""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,123 @@
+"""
+Background prefetch scheduler for the DWD Station Climate Plotter.
+Periodically refreshes the upstream data (DWD archives, forecasts, PV sheet) for all
+configured stations and re-renders the cached dashboard pages, so visitors only ever
+read prepared results.
+"""
+import random
+import threading
+import time
+
+import chronos_forecast
+import climate_stats
+import config
+import http_cache
+import pv_model
+import singleflight
+import weather_logic
+
+_started = {"value": False}
+_start_lock = threading.Lock()
+_warm_lock = threading.Lock()
+_warmed_versions = {"value": None}
+
+
+def _run_single_flight(job_name, interval, job):
+    """
+    Runs job unless another worker process is running it right now or has finished it
+    less than interval seconds ago. Returns True if job ran in this process.
+    """
+    with singleflight.file_lock(f"prefetch_{job_name}", blocking=False) as lock_file:
+        if lock_file is None:
+            return False  # Another worker holds the lock
+        lock_file.seek(0)
+        last_run = float(lock_file.read().strip() or 0)
+        if time.time() - last_run < interval * (1 - config.PREFETCH_JITTER):
+            return False
+        job()
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(time.time()))
+        return True
+
+
+def refresh_dwd():
+    """
+    Revalidates the DWD listing and all recent station ZIPs (historical ones on their own
+    TTL) and updates the merged stores and their climate statistics.
+    """
+    http_cache.fetch(config.DWD_URL, ttl=0)
+    for station_id in config.STATIONS:
+        data = weather_logic.load_station(station_id, zip_ttl=0)
+        if data is None:
+            print(f"Prefetch: no DWD archive for station {station_id}")
+            continue
+        climate_stats.get_stats(station_id, data)
+
+
+def refresh_forecast():
+    """Downloads the forecasts of all stations for the current model run (one batched request)."""
+    weather_logic.get_forecast_batch()
+
+
+def refresh_pv():
+    """Downloads the PV sheet and fits the model if the sheet changed."""
+    http_cache.fetch(config.PV_DATA_URL, ttl=0)
+    pv_model.get_model(weather_logic.fetch_pv_sheet())
+
+
+def refresh_chronos():
+    """Runs the Chronos model for all stations if new hourly observations were published."""
+    chronos_forecast.refresh()
+
+
+JOBS = {
+    "dwd": refresh_dwd,
+    "forecast": refresh_forecast,
+    "pv": refresh_pv,
+    "chronos": refresh_chronos
+}
+
+
+def _warm_if_changed(warm_pages):
+    """
+    Calls warm_pages() if the data versions of the configured stations changed since the
+    last call. Pages live in each worker's memory, so every worker re-renders its own,
+    also after another worker ran the job (the disk caches are shared).
+    """
+    with _warm_lock:
+        versions = {station_id: weather_logic.data_versions(station_id) for station_id in config.STATIONS}
+        if versions != _warmed_versions["value"]:
+            warm_pages()
+            _warmed_versions["value"] = versions
+
+
+def _job_loop(job_name, job, warm_pages):
+    interval = config.PREFETCH_INTERVALS[job_name]
+    delay = random.uniform(0, config.PREFETCH_STARTUP_DELAY)
+    while True:
+        time.sleep(delay)
+        try:
+            _run_single_flight(job_name, interval, job)
+            _warm_if_changed(warm_pages)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Prefetch Error ({job_name}): {exc}")
+        delay = interval * random.uniform(1 - config.PREFETCH_JITTER, 1 + config.PREFETCH_JITTER)
+
+
+def start(warm_pages):
+    """
+    Starts one daemon thread per upstream source. warm_pages() is called after a job run
+    changed the data of a configured station and should re-render all cached pages whose
+    data versions changed.
+    """
+    with _start_lock:
+        if _started["value"]:
+            return
+        _started["value"] = True
+
+    for job_name, job in JOBS.items():
+        threading.Thread(
+            target=_job_loop, args=(job_name, job, warm_pages),
+            name=f"prefetch-{job_name}", daemon=True
+        ).start()
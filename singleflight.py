@@ -0,0 +1,111 @@
+"""
+Request coalescing for the DWD Station Climate Plotter.
+Concurrent callers asking for the same key share one in-flight execution and its result,
+across threads and (through a local file lock) across worker processes.
+"""
+import contextlib
+import hashlib
+import os
+import threading
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: file locks are a no-op, coalescing stays per process
+    fcntl = None
+
+
+class _Call:
+    """One in-flight execution that other threads can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def _same_file(f_obj, path):
+    try:
+        return os.fstat(f_obj.fileno()).st_ino == os.stat(path).st_ino
+    except OSError:
+        return False
+
+
+@contextlib.contextmanager
+def file_lock(name, blocking=True, remove=False):
+    """
+    Holds an exclusive lock on cache/locks/<name>.lock and yields the open lock file.
+    With blocking=False, yields None instead if another process holds the lock.
+    With remove=True the lock file is deleted again before it is unlocked, so per-key
+    locks do not pile up; a waiter that then holds the lock on the deleted file retries.
+    """
+    path = os.path.join(config.CACHE_DIR, "locks", f"{name}.lock")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        lock_file = open(path, "a+", encoding="utf-8")  # pylint: disable=consider-using-with
+        acquired = True
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                acquired = False
+        if acquired and remove and fcntl is not None and not _same_file(lock_file, path):
+            lock_file.close()  # The previous holder removed the file while we waited
+            continue
+        break
+
+    with lock_file:
+        try:
+            yield lock_file if acquired else None
+        finally:
+            if acquired and remove:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if acquired and fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def do(key, fn, across_processes=False):
+    """
+    Runs fn() for key unless another thread is already running it, in which case the
+    caller waits for and shares that result (or exception).
+    With across_processes=True the execution is additionally serialized across worker
+    processes; fn should then first check whether another process already stored the
+    result (e.g. in the disk cache) before doing the expensive work.
+    """
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            _calls[key] = call
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        if across_processes:
+            lock_name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+            with file_lock(lock_name, remove=True):
+                call.result = fn()
+        else:
+            call.result = fn()
+        return call.result
+    except BaseException as exc:
+        # Also SystemExit/KeyboardInterrupt, otherwise waiters would get neither result nor error
+        call.error = exc
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
@@ -0,0 +1,224 @@
+"""
+DWD station catalog for the DWD Station Climate Plotter.
+Parses the station description file (KL_Tageswerte_Beschreibung_Stationen.txt) and the
+archive directory listings once per upstream version into indexed structures: a dict by
+station id, a lat/lon grid for nearest-station and radius lookups, and a station id ->
+ZIP file name map per directory. Parsed results are cached on disk.
+"""
+import json
+import math
+import os
+import re
+import threading
+
+import config
+import http_cache
+import singleflight
+
+DESCRIPTION_FILE = "KL_Tageswerte_Beschreibung_Stationen.txt"
+
+_ARCHIVE_LINK = re.compile(r'href="((?:tageswerte|stundenwerte)_[A-Z0-9]+_(\d{5})_[^"]*\.zip)"')
+_EARTH_RADIUS_KM = 6371.0
+_KM_PER_DEGREE = math.pi * _EARTH_RADIUS_KM / 180
+
+_state = {"catalog": None, "listings": {}}
+_lock = threading.Lock()
+
+
+class Station:
+    """One DWD climate station as listed in the station description file."""
+
+    __slots__ = ("station_id", "name", "state", "lat", "lon", "height", "first_day", "last_day")
+
+    def __init__(self, station_id, name, state, lat, lon, height, first_day, last_day):
+        self.station_id = station_id
+        self.name = name
+        self.state = state
+        self.lat = lat
+        self.lon = lon
+        self.height = height
+        self.first_day = first_day  # YYYYMMDD strings as in the DWD file
+        self.last_day = last_day
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance (haversine) in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * _EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Catalog:
+    """Stations by id plus a grid index (CATALOG_GRID_DEGREES cells) on lat/lon."""
+
+    def __init__(self, stations, version=None):
+        self.version = version
+        self.by_id = {station.station_id: station for station in stations}
+        self.grid = {}
+        for station in stations:
+            self.grid.setdefault(self._cell(station.lat, station.lon), []).append(station)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, station_id):
+        return self.by_id.get(station_id)
+
+    @staticmethod
+    def _cell(lat, lon):
+        size = config.CATALOG_GRID_DEGREES
+        return (math.floor(lat / size), math.floor(lon / size))
+
+    def _ring(self, center, radius):
+        """Stations in the grid cells exactly `radius` cells away from center."""
+        row, col = center
+        for d_row in range(-radius, radius + 1):
+            for d_col in range(-radius, radius + 1):
+                if max(abs(d_row), abs(d_col)) == radius:
+                    yield from self.grid.get((row + d_row, col + d_col), ())
+
+    def nearest(self, lat, lon, k=1):
+        """Returns the k stations closest to lat/lon as [(Station, distance_km)], nearest first."""
+        if not self.by_id:
+            return []
+        center = self._cell(lat, lon)
+        size = config.CATALOG_GRID_DEGREES
+        k = min(k, len(self.by_id))
+        found = []
+        for radius in range(int(360 / size) + 1):
+            found.extend((station, distance_km(lat, lon, station.lat, station.lon))
+                         for station in self._ring(center, radius))
+            found.sort(key=lambda item: item[1])
+            # Stations outside the searched rings are at least `radius` cells away
+            cos_lat = math.cos(math.radians(min(abs(lat) + (radius + 1) * size, 90)))
+            unseen_km = radius * size * _KM_PER_DEGREE * cos_lat
+            if len(found) == len(self.by_id) or (len(found) >= k and found[k - 1][1] <= unseen_km):
+                break
+        return found[:k]
+
+    def within(self, lat, lon, radius_km):
+        """Returns all stations within radius_km of lat/lon as [(Station, distance_km)], nearest first."""
+        d_lat = radius_km / _KM_PER_DEGREE
+        d_lon = radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + d_lat, 89))), 1e-6))
+        size = config.CATALOG_GRID_DEGREES
+        found = []
+        for row in range(math.floor((lat - d_lat) / size), math.floor((lat + d_lat) / size) + 1):
+            for col in range(math.floor((lon - d_lon) / size), math.floor((lon + d_lon) / size) + 1):
+                for station in self.grid.get((row, col), ()):
+                    distance = distance_km(lat, lon, station.lat, station.lon)
+                    if distance <= radius_km:
+                        found.append((station, distance))
+        found.sort(key=lambda item: item[1])
+        return found
+
+
+def parse_description(text):
+    """
+    Parses the fixed-width DWD station description file. Station names may contain spaces,
+    so only the numeric columns are split by position; the Bundesland (and the 'Abgabe'
+    column of newer files) are taken from the end of the line.
+    """
+    lines = text.splitlines()
+    has_abgabe = bool(lines) and "Abgabe" in lines[0]
+    stations = []
+    for line in lines[2:]:
+        tokens = line.split()
+        if len(tokens) < 8 or not tokens[0].isdigit():
+            continue
+        name_end = -2 if has_abgabe else -1
+        try:
+            stations.append(Station(
+                station_id=tokens[0].zfill(5),
+                name=" ".join(tokens[6:name_end]),
+                state=tokens[name_end],
+                lat=float(tokens[4]),
+                lon=float(tokens[5]),
+                height=float(tokens[3]),
+                first_day=tokens[1],
+                last_day=tokens[2]
+            ))
+        except ValueError:
+            continue
+    return stations
+
+
+def parse_listing(text):
+    """Maps station id -> ZIP file name for a DWD archive directory listing (one regex pass)."""
+    return {station_id: file_name for file_name, station_id in _ARCHIVE_LINK.findall(text)}
+
+
+def _cache_path():
+    return os.path.join(config.CACHE_DIR, "station_catalog.json")
+
+
+def _load_disk():
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as f_obj:
+            return json.load(f_obj)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_disk(section, values):
+    """Merges values into one section of the disk cache (under a file lock shared by all workers)."""
+    with singleflight.file_lock("station_catalog"):
+        data = _load_disk()
+        data.setdefault(section, {}).update(values)
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        http_cache.atomic_write(_cache_path(), json.dumps(data).encode("utf-8"))
+
+
+def get_catalog():
+    """
+    Returns the Catalog of all DWD daily climate stations. The description file is
+    revalidated every CATALOG_TTL seconds and only parsed again when it changed.
+    """
+    entry = http_cache.fetch(config.DWD_URL + DESCRIPTION_FILE, ttl=config.CATALOG_TTL)
+    catalog = _state["catalog"]
+    if catalog is not None and catalog.version == entry.version:
+        return catalog
+
+    with _lock:
+        stored = _load_disk().get("description", {})
+        if stored.get("version") == entry.version:
+            stations = [Station(**fields) for fields in stored["stations"]]
+        else:
+            # DWD publishes this file in ISO-8859-1
+            stations = parse_description(entry.read_text(encoding="latin-1"))
+            _save_disk("description", {"version": entry.version,
+                                       "stations": [station.to_dict() for station in stations]})
+        catalog = Catalog(stations, version=entry.version)
+        _state["catalog"] = catalog
+    return catalog
+
+
+def get_station(station_id):
+    """Returns the catalog Station for station_id, or None if it is unknown or the catalog is unavailable."""
+    try:
+        return get_catalog().get(station_id)
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        print(f"Station Catalog Error: {exc}")
+        return None
+
+
+def archive_name(base_url, station_id, ttl):
+    """
+    Returns the ZIP file name of station_id in the DWD directory base_url (or None).
+    The listing is revalidated every ttl seconds and indexed once per version.
+    """
+    entry = http_cache.fetch(base_url, ttl=ttl)
+    listing = _state["listings"].get(base_url)
+    if listing is None or listing["version"] != entry.version:
+        with _lock:
+            stored = _load_disk().get("listings", {}).get(base_url)
+            if stored is not None and stored.get("version") == entry.version:
+                listing = stored
+            else:
+                listing = {"version": entry.version, "files": parse_listing(entry.read_text())}
+                _save_disk("listings", {base_url: listing})
+            _state["listings"][base_url] = listing
+    return listing["files"].get(station_id)
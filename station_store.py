@@ -0,0 +1,398 @@
+"""
+Columnar station store for the DWD Station Climate Plotter.
+Parses a station's produkt_*.txt files once into NumPy arrays and persists them as .npz,
+keyed by the versions (ETag/Last-Modified) of the source ZIP archives. The long-term
+'historical' archive and the 'recent' archive are merged into one date index, with
+monthly and yearly aggregates precomputed for long-range views. A new version of the
+recent archive is applied incrementally: only newer days are appended and revised days
+updated, and every update is recorded in cache/stations/<id>_changes.jsonl.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from datetime import date
+
+import numpy as np
+
+import config
+import http_cache
+import metrics
+import singleflight
+
+# DWD column -> attribute name
+VALUE_COLUMNS = {"TMK": "temp", "RSK": "rain", "SDK": "sun", "FX": "wind"}
+COLUMN_NAMES = tuple(VALUE_COLUMNS.values())
+
+# Aggregate levels -> NumPy datetime unit of one period
+AGGREGATE_LEVELS = {"month": "M", "year": "Y"}
+
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+_memory = {}
+_lock = threading.Lock()
+
+
+class StationData:
+    """
+    Daily observations of one station as sorted, parallel NumPy columns.
+    For merged archives, .aggregates maps "month"/"year" to a StationData whose dates are
+    the first day of each period (mean temp, rain/sun totals, maximum wind gust).
+    """
+
+    def __init__(self, dates, temp, rain, sun, wind, version=None):
+        self.dates = dates  # int32 proleptic Gregorian ordinals, ascending
+        self.temp = temp
+        self.rain = rain
+        self.sun = sun
+        self.wind = wind
+        self.version = version
+        self.aggregates = {}
+        self.historical_last = 0  # Last day taken from the historical archive (0: none)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def window(self, first_ordinal, last_ordinal):
+        """Returns the index slice covering first_ordinal..last_ordinal (inclusive)."""
+        lo = np.searchsorted(self.dates, first_ordinal, side="left")
+        hi = np.searchsorted(self.dates, last_ordinal, side="right")
+        return slice(lo, hi)
+
+
+def _store_path(name):
+    return os.path.join(config.CACHE_DIR, "stations", f"{name}.npz")
+
+
+def archive_version(zip_entry, historical_entry=None):
+    """Version string of the merged store built from a recent and an optional historical archive."""
+    historical = historical_entry.version if historical_entry is not None else ""
+    return f"{historical or ''}|{zip_entry.version or ''}"
+
+
+def _stored_version(name):
+    """Version of a stored .npz without loading its arrays (None if there is none)."""
+    try:
+        with np.load(_store_path(name)) as npz:
+            return str(npz["version"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def store_version(station_id, zip_entry, historical_entry=None):
+    """
+    archive_version() of the store get_station_data() returns for these archives. Without
+    a historical archive (e.g. the listing or download failed), the historical part of the
+    existing store and its version are kept, so a short outage does not drop its history.
+    """
+    version = archive_version(zip_entry, historical_entry)
+    if historical_entry is not None:
+        return version
+    with _lock:
+        cached = _memory.get(station_id)
+    stored = cached.version if cached is not None else _stored_version(station_id)
+    historical = (stored or "").split("|", 1)[0]
+    return historical + version
+
+
+def iter_rows(path, first=None, last=None):
+    """
+    Lazily yields (ordinal, temp, rain, sun, wind) from the produkt_ file inside a DWD
+    station ZIP, streaming the member through a TextIOWrapper instead of decoding it whole.
+    Rows before first are skipped; since DWD files are sorted by date, reading stops at the
+    first row after last. Missing values (-999, blanks) are NaN.
+    """
+    with zipfile.ZipFile(path) as z_file:
+        data_filename = [n for n in z_file.namelist() if n.startswith("produkt_")][0]
+        with z_file.open(data_filename) as raw, io.TextIOWrapper(raw, encoding="latin-1") as f_obj:
+            reader = csv.reader(f_obj, delimiter=";", skipinitialspace=True)
+            header = next(reader, None)
+            if header is None:  # Empty member
+                return
+            header = [name.strip() for name in header]
+            date_idx = header.index("MESS_DATUM" if "MESS_DATUM" in header else "MESS_DATUM_BEGINN")
+            value_idx = [header.index(col) if col in header else None for col in VALUE_COLUMNS]
+
+            for fields in reader:
+                try:
+                    stamp = fields[date_idx].strip()
+                    ordinal = date(int(stamp[:4]), int(stamp[4:6]), int(stamp[6:8])).toordinal()
+                except (IndexError, ValueError):
+                    continue
+                if first is not None and ordinal < first:
+                    continue
+                if last is not None and ordinal > last:
+                    break
+                yield (ordinal, *(_value(fields, idx) for idx in value_idx))
+
+
+def _value(fields, idx):
+    try:
+        value = float(fields[idx])
+    except (TypeError, IndexError, ValueError):
+        return np.nan
+    return np.nan if value <= -900 else value  # DWD marks missing values with -999
+
+
+def parse_zip(path, first=None, last=None):
+    """Parses the produkt_ file inside a DWD station ZIP (optionally a date window) into a StationData."""
+    # Rows go straight into one structured array, no intermediate list of tuples
+    row_dtype = [("dates", np.int32)] + [(attr, np.float32) for attr in COLUMN_NAMES]
+    rows = np.fromiter(iter_rows(path, first, last), dtype=row_dtype)
+
+    order = np.argsort(rows["dates"], kind="stable")
+    return StationData(rows["dates"][order], **{attr: rows[attr][order] for attr in COLUMN_NAMES})
+
+
+def merge(historical, recent):
+    """
+    Merges the historical and the recent archive into one date index. Days contained in
+    both keep the quality-controlled values of the historical archive.
+    """
+    if historical is None or len(historical) == 0:
+        return StationData(recent.dates, *(getattr(recent, name) for name in COLUMN_NAMES))
+    dates = np.concatenate((historical.dates, recent.dates))
+    # np.unique sorts and returns the first occurrence, i.e. the historical row
+    dates, first = np.unique(dates, return_index=True)
+    columns = {name: np.concatenate((getattr(historical, name), getattr(recent, name)))[first]
+               for name in COLUMN_NAMES}
+    merged = StationData(dates.astype(np.int32), **columns)
+    merged.historical_last = int(historical.dates[-1])
+    return merged
+
+
+def apply_recent(previous, recent):
+    """
+    Applies a new version of the recent archive to a merged store: days after the last
+    stored day are appended, days missing in the store inserted, and stored days newer than
+    the historical archive whose values differ (DWD corrections) are updated.
+    Returns (data, changes) with changes = {"appended": [...], "revised": [...]} (ordinals).
+    """
+    pos = np.minimum(np.searchsorted(previous.dates, recent.dates), max(len(previous) - 1, 0))
+    found = previous.dates[pos] == recent.dates if len(previous) else np.zeros(len(recent), dtype=bool)
+
+    columns = {name: getattr(previous, name).copy() for name in COLUMN_NAMES}
+    revised = np.zeros(len(recent), dtype=bool)
+    reconcile = found & (recent.dates > previous.historical_last)
+    for name in COLUMN_NAMES:
+        old, new = columns[name][pos[reconcile]], getattr(recent, name)[reconcile]
+        differs = ~((old == new) | (np.isnan(old) & np.isnan(new)))
+        revised[np.flatnonzero(reconcile)[differs]] = True
+    for name in COLUMN_NAMES:
+        columns[name][pos[revised]] = getattr(recent, name)[revised]
+
+    dates = previous.dates
+    added = ~found
+    if added.any():
+        dates = np.concatenate((dates, recent.dates[added]))
+        columns = {name: np.concatenate((values, getattr(recent, name)[added])) for name, values in columns.items()}
+        if len(previous) and recent.dates[added][0] < previous.dates[-1]:  # Gap filled, restore order
+            order = np.argsort(dates, kind="stable")
+            dates, columns = dates[order], {name: values[order] for name, values in columns.items()}
+
+    data = StationData(dates, **columns)
+    data.historical_last = previous.historical_last
+    changes = {"appended": recent.dates[added].tolist(), "revised": recent.dates[revised].tolist()}
+    return data, changes
+
+
+def aggregate(data, level):
+    """Monthly or yearly aggregates of daily data: mean temp, rain/sun totals, max wind."""
+    days = (data.dates.astype(np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+    periods = days.astype(f"datetime64[{AGGREGATE_LEVELS[level]}]")
+    if len(periods) == 0:
+        empty = np.array([], dtype=np.float32)
+        return StationData(np.array([], dtype=np.int32), empty, empty, empty, empty)
+
+    starts = np.concatenate(([0], np.flatnonzero(periods[1:] != periods[:-1]) + 1))
+    period_dates = (periods[starts].astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL).astype(np.int32)
+
+    columns = {}
+    for name in COLUMN_NAMES:
+        values = getattr(data, name).astype(np.float64)
+        valid = np.add.reduceat(~np.isnan(values), starts)
+        if name == "wind":
+            with np.errstate(invalid="ignore"):
+                result = np.fmax.reduceat(values, starts)
+        else:
+            result = np.add.reduceat(np.nan_to_num(values), starts)
+            if name == "temp":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result = result / valid
+        result[valid == 0] = np.nan
+        columns[name] = result.astype(np.float32)
+    return StationData(period_dates, **columns)
+
+
+def update_aggregates(data, previous_aggregates, first_changed):
+    """Recomputes only the aggregate periods from the one containing first_changed onwards."""
+    aggregates = {}
+    for level, unit in AGGREGATE_LEVELS.items():
+        previous = previous_aggregates.get(level)
+        if previous is None:
+            aggregates[level] = aggregate(data, level)
+            continue
+        day = np.datetime64(int(first_changed) - _EPOCH_ORDINAL, "D")
+        period_start = int(day.astype(f"datetime64[{unit}]").astype("datetime64[D]").astype(np.int64)) + _EPOCH_ORDINAL
+        keep = np.searchsorted(previous.dates, period_start)
+        tail = aggregate(StationData(*(values[np.searchsorted(data.dates, period_start):]
+                                       for values in (data.dates, data.temp, data.rain, data.sun, data.wind))), level)
+        aggregates[level] = StationData(
+            np.concatenate((previous.dates[:keep], tail.dates)),
+            *(np.concatenate((getattr(previous, name)[:keep], getattr(tail, name))) for name in COLUMN_NAMES))
+    return aggregates
+
+
+def _changes_path(station_id):
+    return os.path.join(config.CACHE_DIR, "stations", f"{station_id}_changes.jsonl")
+
+
+def _iso(ordinal):
+    return str(np.datetime64(int(ordinal) - _EPOCH_ORDINAL, "D"))
+
+
+def _record_changes(station_id, version, changes, last_day):
+    """
+    Appends one line per ingested archive version to the station's change log. Once the
+    log exceeds STATION_CHANGES_MAX_BYTES it is cut down to the last STATION_CHANGES_KEEP lines.
+    """
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "version": version,
+        "last_day": _iso(last_day),
+        "appended": len(changes["appended"]),
+        "appended_from": _iso(changes["appended"][0]) if changes["appended"] else None,
+        "revised": [_iso(day) for day in changes["revised"]]
+    }
+    path = _changes_path(station_id)
+    with open(path, "a", encoding="utf-8") as f_obj:
+        f_obj.write(json.dumps(entry) + "\n")
+        size = f_obj.tell()
+    if size > config.STATION_CHANGES_MAX_BYTES:
+        with open(path, "r", encoding="utf-8") as f_obj:
+            kept = deque(f_obj, maxlen=config.STATION_CHANGES_KEEP)
+        http_cache.atomic_write(path, "".join(kept).encode("utf-8"))
+
+
+def last_changes(station_id, limit=10):
+    """Returns the most recent change log entries of a station, newest first."""
+    try:
+        with open(_changes_path(station_id), "r", encoding="utf-8") as f_obj:
+            lines = deque(f_obj, maxlen=limit)
+    except OSError:
+        return []
+    return [json.loads(line) for line in reversed(lines)]
+
+
+def _arrays(data, prefix=""):
+    return {f"{prefix}{name}": getattr(data, name) for name in ("dates",) + COLUMN_NAMES}
+
+
+def _from_arrays(npz, prefix=""):
+    return StationData(*(npz[f"{prefix}{name}"] for name in ("dates",) + COLUMN_NAMES))
+
+
+def _save(name, data):
+    path = _store_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = _arrays(data)
+    for level, aggregated in data.aggregates.items():
+        arrays.update(_arrays(aggregated, prefix=f"{level}_"))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f_obj:
+            np.savez(f_obj, version=np.array(data.version or ""),
+                     historical_last=np.array(data.historical_last), **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load(name, version):
+    """Loads a stored .npz if its version matches (version=None accepts any version)."""
+    try:
+        with np.load(_store_path(name)) as npz:
+            if version is not None and str(npz["version"]) != version:
+                return None
+            data = _from_arrays(npz)
+            data.version = str(npz["version"])
+            if "historical_last" in npz.files:
+                data.historical_last = int(npz["historical_last"])
+            for level in AGGREGATE_LEVELS:
+                if f"{level}_dates" in npz.files:
+                    data.aggregates[level] = _from_arrays(npz, prefix=f"{level}_")
+            return data
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def get_station_data(station_id, zip_entry, historical_entry=None):
+    """
+    Returns the merged StationData for the cached 'recent' station ZIP and, if given, the
+    'historical' ZIP (see http_cache.CacheEntry). Archives are only parsed when their
+    version differs from the stored one. If only the recent archive changed, its newer and
+    revised days are applied to the previous store instead of rebuilding it.
+    """
+    version = store_version(station_id, zip_entry, historical_entry)
+    with _lock:
+        cached = _memory.get(station_id)
+    if cached is not None and cached.version == version:
+        metrics.inc("cache_lookups_total", cache="station_store", result="hit")
+        return cached
+
+    # Only one thread/worker parses new archives, the others load the .npz
+    metrics.inc("cache_lookups_total", cache="station_store", result="miss")
+    with metrics.stage("station_store"):
+        return singleflight.do(
+            ("station_store", station_id, version),
+            lambda: _load_or_parse(station_id, zip_entry, historical_entry, version, previous=cached),
+            across_processes=True
+        )
+
+
+def _historical_part(station_id, version, historical_entry):
+    name = f"{station_id}_historical"
+    data = _load(name, version)
+    if data is None:
+        if historical_entry is None:
+            # Never replace the store with one that lost its history
+            raise LookupError(f"Historical archive of station {station_id} is unavailable.")
+        data = parse_zip(historical_entry.path)
+        data.version = version
+        _save(name, data)
+    return data
+
+
+def _load_or_parse(station_id, zip_entry, historical_entry, version, previous=None):
+    data = _load(station_id, version)
+    if data is None:
+        if previous is None:
+            previous = _load(station_id, None)
+        historical_version = version.split("|", 1)[0]
+        if previous is not None and previous.version.split("|", 1)[0] == historical_version:
+            # Days up to the end of the historical archive are never taken from the recent one
+            recent = parse_zip(zip_entry.path, first=previous.historical_last + 1)
+            data, changes = apply_recent(previous, recent)
+            changed = changes["appended"] + changes["revised"]
+            data.aggregates = (update_aggregates(data, previous.aggregates, min(changed)) if changed
+                               else previous.aggregates)
+        else:
+            historical = (_historical_part(station_id, historical_version, historical_entry)
+                          if historical_entry is not None or historical_version else None)
+            data = merge(historical, parse_zip(zip_entry.path))
+            data.aggregates = {level: aggregate(data, level) for level in AGGREGATE_LEVELS}
+            changes = {"appended": data.dates.tolist(), "revised": []}
+        data.version = version
+        _save(station_id, data)
+        _record_changes(station_id, version, changes, int(data.dates[-1]) if len(data) else 0)
+
+    with _lock:
+        _memory[station_id] = data
+    return data
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import pandas as pd
 import torch
@@ -6,130 +8,297 @@ import matplotlib.pyplot as plt
 from chronos import Chronos2Pipeline
 from huggingface_hub import login
 
-def apply_physical_constraints(pred_df):
+QUANTILE_LEVELS = (0.1, 0.5, 0.9)
+
+DEFAULT_STATION = "02667"  # Köln/Bonn
+FEATURE_DIR = "feature_store"  # Prepared hourly features (memory-mapped .npy per station)
+
+# Raw wetterdienst exports; other stations use dwd_hourly_<id>.csv
+SOURCE_FILES = {"02667": "koeln_bonn_weather.csv"}
+STATION_LABELS = {"02667": "Köln/Bonn"}
+
+WEATHER_TARGETS = ['Temp (°C)', 'Rain (mm)', 'Sun (h)', 'Wind (m/s)']
+TIME_COVARIATES = ['Hour_sin', 'Hour_cos', 'Day_sin', 'Day_cos']
+FEATURE_COLUMNS = WEATHER_TARGETS + TIME_COVARIATES
+
+# Map standard wetterdienst parameters to the target names
+RENAME_MAPPING = {
+    'temperature_air_mean_200': 'Temp (°C)',
+    'temperature_air_mean_2m': 'Temp (°C)',
+    'precipitation_height': 'Rain (mm)',
+    'sunshine_duration': 'Sun (h)',
+    'wind_speed': 'Wind (m/s)'
+}
+
+# Physically possible ranges (lower, upper) of the forecast targets, None = unbounded
+PHYSICAL_BOUNDS = {
+    'Rain (mm)': (0, None),
+    'Sun (h)': (0, 1.0),
+    'Wind (m/s)': (0, None)
+}
+
+def clip_physical(values, targets):
     """
-    Ensures forecasts stay within physically possible boundaries.
-    - Rain (mm): Cannot be negative.
-    - Sun (h): Must be between 0 and 1 (max 1 hour of sun per hour).
-    - Wind (m/s): Cannot be negative.
+    Ensures forecasts stay within physically possible boundaries (PHYSICAL_BOUNDS):
+    clips values (targets on axis 1) in place, e.g. no negative rain or wind and at most
+    1 hour of sun per hour.
     """
-    # 1. Identify only the quantile columns (e.g., '0.1', '0.5', '0.9')
-    # These are usually the columns that can be converted to numeric
-    cols_to_fix = [c for c in pred_df.columns if c not in ['item_id', 'timestamp']]
-    
-    # 2. Ensure these columns are numeric (float)
-    for col in cols_to_fix:
-        pred_df[col] = pd.to_numeric(pred_df[col], errors='coerce')
+    for i, target in enumerate(targets):
+        if target in PHYSICAL_BOUNDS:
+            lower, upper = PHYSICAL_BOUNDS[target]
+            np.clip(values[:, i], lower, upper, out=values[:, i])
+    return values
 
-    # 3. Apply masks and clip
-    # Rain and Wind >= 0
-    rain_wind_mask = pred_df['item_id'].str.contains('Rain|Wind')
-    pred_df.loc[rain_wind_mask, cols_to_fix] = pred_df.loc[rain_wind_mask, cols_to_fix].clip(lower=0)
 
-    # Sun between 0 and 1
-    sun_mask = pred_df['item_id'].str.contains('Sun')
-    pred_df.loc[sun_mask, cols_to_fix] = pred_df.loc[sun_mask, cols_to_fix].clip(lower=0, upper=1.0)
+def series_id(station_id):
+    """Series id of a station in the forecast frames (item ids are '<series id>_<target>')."""
+    return "Koeln_Bonn_Station" if station_id == DEFAULT_STATION else f"DWD_{station_id}_Station"
 
-    return pred_df
 
+def _download_station_csv(station_id, csv_path, periods="historical"):
+    """
+    Downloads the hourly DWD observations of station_id via wetterdienst into csv_path.
+    If csv_path already exists, only rows newer than its last row are appended.
+    """
+    try:
+        from wetterdienst.provider.dwd.observation import DwdObservationRequest
+    except ImportError:
+        raise ImportError(
+            "The 'wetterdienst' library is required to download the data automatically. "
+            "Please install it using: pip install wetterdienst polars"
+        )
 
-def prepare_dwd_data():
-    """Loads and prepares the DWD Köln/Bonn dataset, downloading it if necessary."""
-    csv_path = "koeln_bonn_weather.csv"
-    
-    # --- AUTO-DOWNLOAD LOGIC ---
-    if not os.path.exists(csv_path):
-        print(f"'{csv_path}' not found. Downloading via wetterdienst...")
-        try:
-            from wetterdienst.provider.dwd.observation import DwdObservationRequest
-        except ImportError:
-            raise ImportError(
-                "The 'wetterdienst' library is required to download the data automatically. "
-                "Please install it using: pip install wetterdienst polars"
-            )
-
-        # Define the request for Station 02667 (Köln/Bonn) using the updated API
-        request = DwdObservationRequest(
-            parameters=[
-                ("hourly", "temperature_air"),
-                ("hourly", "precipitation"),
-                ("hourly", "sun"),
-                ("hourly", "wind")
-            ],
-            periods="historical"
-        ).filter_by_station_id(station_id=["02667"])
-
-        # Fetch data (returns a polars DataFrame, convert to pandas)
-        print("Fetching historical data from DWD... this may take a moment.")
-        df_long = request.values.all().df.to_pandas()
-
-        # Wetterdienst returns data in a "long" format. Pivot it to "wide" format.
-        df_wide = df_long.pivot_table(
-            index="date",
-            columns="parameter",
-            values="value"
-        ).reset_index()
+    # Define the request for the station using the updated API
+    request = DwdObservationRequest(
+        parameters=[
+            ("hourly", "temperature_air"),
+            ("hourly", "precipitation"),
+            ("hourly", "sun"),
+            ("hourly", "wind")
+        ],
+        periods=periods
+    ).filter_by_station_id(station_id=[station_id])
 
+    # Fetch data (returns a polars DataFrame, convert to pandas)
+    print(f"Fetching {periods} data for station {station_id} from DWD... this may take a moment.")
+    df_long = request.values.all().df.to_pandas()
+
+    # Wetterdienst returns data in a "long" format. Pivot it to "wide" format.
+    df_wide = df_long.pivot_table(
+        index="date",
+        columns="parameter",
+        values="value"
+    ).reset_index()
+
+    if not os.path.exists(csv_path):
         # Save to CSV so we don't have to download it again on the next run
         df_wide.to_csv(csv_path, index=False)
         print(f"Data successfully saved to '{csv_path}'.")
-    # ---------------------------
+        return
 
-    # Load the CSV (either pre-existing or just downloaded)
-    df = pd.read_csv(csv_path)
-    
+    # Append only the new hours, in the column order of the existing file, so the
+    # feature store can extend its cached frame instead of rebuilding it
+    header = pd.read_csv(csv_path, nrows=0).columns
+    last_date = pd.to_datetime(_last_csv_row(csv_path)[header.get_loc('date')], utc=True)
+    new_rows = df_wide[pd.to_datetime(df_wide['date'], utc=True) > last_date].reindex(columns=header)
+    new_rows.to_csv(csv_path, mode='a', header=False, index=False)
+    print(f"Appended {len(new_rows)} new hours to '{csv_path}'.")
+
+
+def _last_csv_row(path):
+    """Fields of the last line of a CSV file, read from its end."""
+    with open(path, 'rb') as f_obj:
+        f_obj.seek(0, os.SEEK_END)
+        f_obj.seek(max(0, f_obj.tell() - 65536))
+        last_line = f_obj.read().rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+    return last_line.decode("utf-8").split(",")
+
+
+def _hash_file(path, prefix_size=None):
+    """SHA-1 of the whole file and of its first prefix_size bytes (None if not requested)."""
+    digest = hashlib.sha1()
+    prefix_hash = None
+    with open(path, 'rb') as f_obj:
+        if prefix_size is not None:
+            remaining = prefix_size
+            while remaining > 0:
+                chunk = f_obj.read(min(1 << 20, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            prefix_hash = digest.hexdigest()
+        for chunk in iter(lambda: f_obj.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest(), prefix_hash
+
+
+def _raw_to_hourly(df, sun_scale=None):
+    """
+    Turns raw wetterdienst rows into hourly means of the weather targets (not yet filled).
+    Returns (frame indexed by timestamp, sun_scale) so appended rows reuse the unit
+    decision made for the whole file.
+    """
     # 1. Parse timestamps (Wetterdienst exports ISO 8601 dates with UTC timezone)
     df['timestamp'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None)
-    
+
     # 2. Map standard wetterdienst parameters to your requested target names
-    rename_mapping = {
-        'temperature_air_mean_200': 'Temp (°C)',
-        'temperature_air_mean_2m': 'Temp (°C)',
-        'precipitation_height': 'Rain (mm)',
-        'sunshine_duration': 'Sun (h)',
-        'wind_speed': 'Wind (m/s)'
-    }
-    df = df.rename(columns=rename_mapping)
-    
+    df = df.rename(columns=RENAME_MAPPING)
+
     # 3. Data correction: DWD records sunshine duration in minutes. Convert to hours.
-    if 'Sun (h)' in df.columns and df['Sun (h)'].max() > 60:
-        df['Sun (h)'] = df['Sun (h)'] / 60.0 
-    
+    if sun_scale is None:
+        sun_scale = 60.0 if 'Sun (h)' in df.columns and df['Sun (h)'].max() > 60 else 1.0
+    if 'Sun (h)' in df.columns:
+        df['Sun (h)'] = df['Sun (h)'] / sun_scale
+
     # 4. Select Base Weather Features
-    weather_features = ['timestamp', 'Temp (°C)', 'Rain (mm)', 'Sun (h)', 'Wind (m/s)']
-    
+    weather_features = ['timestamp'] + WEATHER_TARGETS
+
     missing_cols = [col for col in weather_features if col not in df.columns]
     if missing_cols:
         raise ValueError(f"Missing expected columns from DWD data: {missing_cols}. Current columns: {list(df.columns)}")
-        
+
     df = df[weather_features]
-    
+
     # Drop initial historical rows where main sensors weren't active yet
     df = df.dropna(subset=['Temp (°C)'])
-    
+
     # 5. Resample to strict 1-hour intervals BEFORE adding time covariates
-    print("Resampling data to strict 1-hour intervals...")
-    df = df.set_index('timestamp').resample('1h').mean().ffill().reset_index()
-    
-    # --- ADD CYCLICAL TIME COVARIATES ---
+    return df.set_index('timestamp').resample('1h').mean(), sun_scale
+
+
+def _time_covariates(timestamps):
+    """Cyclical hour-of-day and day-of-year covariates as a (n, 4) array."""
     # We add these after resampling so the sine/cosine waves are mathematically perfect
     # and not distorted by forward-filling missing rows.
-    df['Hour_sin'] = np.sin(2 * np.pi * df['timestamp'].dt.hour / 24.0)
-    df['Hour_cos'] = np.cos(2 * np.pi * df['timestamp'].dt.hour / 24.0)
-    df['Day_sin'] = np.sin(2 * np.pi * df['timestamp'].dt.dayofyear / 365.25)
-    df['Day_cos'] = np.cos(2 * np.pi * df['timestamp'].dt.dayofyear / 365.25)
-    # ------------------------------------
+    timestamps = pd.DatetimeIndex(timestamps)
+    hour = 2 * np.pi * timestamps.hour.to_numpy() / 24.0
+    day = 2 * np.pi * timestamps.dayofyear.to_numpy() / 365.25
+    return np.column_stack([np.sin(hour), np.cos(hour), np.sin(day), np.cos(day)])
+
+
+def _store_paths(feature_dir, station_id, source_hash):
+    base = os.path.join(feature_dir, f"features_{station_id}")
+    key = f"{base}_{source_hash[:16]}"
+    return f"{base}.json", f"{key}_values.npy", f"{key}_timestamps.npy"
+
+
+def _write_features(feature_dir, station_id, meta, timestamps, values):
+    """Writes the feature arrays under a name keyed by the source hash, then the metadata."""
+    os.makedirs(feature_dir, exist_ok=True)
+    meta_path, values_path, timestamps_path = _store_paths(feature_dir, station_id, meta['source_hash'])
+    for path, array in ((values_path, values), (timestamps_path, timestamps)):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f_obj:
+            np.save(f_obj, array)
+        os.replace(tmp_path, path)
+    with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f_obj:
+        json.dump(meta, f_obj, indent=1)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    # Remove the arrays of older source versions
+    keep = {os.path.basename(values_path), os.path.basename(timestamps_path)}
+    prefix = f"features_{station_id}_"
+    for name in os.listdir(feature_dir):
+        if name.startswith(prefix) and name.endswith(".npy") and name not in keep:
+            os.remove(os.path.join(feature_dir, name))
+
+
+def load_hourly_features(station_id, csv_path, feature_dir=FEATURE_DIR):
+    """
+    Prepared hourly features of station_id: a frame with 'timestamp' and FEATURE_COLUMNS
+    (float32). The prepared frame is stored as memory-mapped .npy files keyed by station
+    and source-file hash, so later runs load it without parsing the CSV. If rows were
+    appended to the CSV since, only the new tail is parsed and resampled.
+    """
+    meta_path = _store_paths(feature_dir, station_id, "")[0]
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f_obj:
+            meta = json.load(f_obj)
+
+    source_size = os.path.getsize(csv_path)
+    cached_size = meta['source_size'] if meta and meta['source_size'] <= source_size else None
+    source_hash, prefix_hash = _hash_file(csv_path, cached_size)
+
+    if meta and source_hash == meta['source_hash']:
+        print(f"Loading cached features for station {station_id}...")
+        _, values_path, timestamps_path = _store_paths(feature_dir, station_id, source_hash)
+        timestamps = np.load(timestamps_path, mmap_mode='r')
+        values = np.load(values_path, mmap_mode='r')
+    elif meta and prefix_hash == meta['source_hash']:
+        print(f"Source grew by {source_size - cached_size} bytes, preparing only the new hours...")
+        _, values_path, timestamps_path = _store_paths(feature_dir, station_id, meta['source_hash'])
+        old_timestamps = np.load(timestamps_path)
+        old_values = np.load(values_path)
+        with open(csv_path, 'rb') as f_obj:
+            f_obj.seek(cached_size)
+            raw_tail = pd.read_csv(f_obj, header=None, names=meta['header'])
+
+        tail, _ = _raw_to_hourly(raw_tail, meta['sun_scale'])
+        last = pd.Timestamp(old_timestamps[-1])
+        tail = tail[tail.index > last]
+        # Seed with the last cached hour so gaps up to the first new hour are forward-filled
+        seed = pd.DataFrame(old_values[-1:, :len(WEATHER_TARGETS)], index=[last], columns=WEATHER_TARGETS)
+        tail = pd.concat([seed, tail]).resample('1h').mean().ffill().iloc[1:]
+
+        new_values = np.hstack([tail[WEATHER_TARGETS].to_numpy(), _time_covariates(tail.index)]).astype(np.float32)
+        timestamps = np.concatenate([old_timestamps, tail.index.to_numpy(dtype='datetime64[ns]')])
+        values = np.concatenate([old_values, new_values])
+        meta.update(source_hash=source_hash, source_size=source_size, rows=len(values))
+        _write_features(feature_dir, station_id, meta, timestamps, values)
+    else:
+        print(f"Preparing features for station {station_id} from '{csv_path}'...")
+        raw = pd.read_csv(csv_path)
+        header = list(raw.columns)
+        print("Resampling data to strict 1-hour intervals...")
+        hourly, sun_scale = _raw_to_hourly(raw)
+        hourly = hourly.ffill()
+
+        timestamps = hourly.index.to_numpy(dtype='datetime64[ns]')
+        values = np.hstack([hourly[WEATHER_TARGETS].to_numpy(), _time_covariates(hourly.index)]).astype(np.float32)
+        meta = {
+            'station_id': station_id,
+            'source_hash': source_hash,
+            'source_size': source_size,
+            'header': header,
+            'sun_scale': sun_scale,
+            'columns': FEATURE_COLUMNS,
+            'rows': len(values)
+        }
+        _write_features(feature_dir, station_id, meta, timestamps, values)
+
+    df = pd.DataFrame(values, columns=FEATURE_COLUMNS, copy=False)
+    df.insert(0, 'timestamp', timestamps)
+    return df
+
+
+def prepare_dwd_data(station_id=DEFAULT_STATION, feature_dir=FEATURE_DIR, refresh=False):
+    """
+    Loads and prepares the hourly DWD dataset of station_id, downloading it if necessary.
+    With refresh, the recent observations are downloaded and the new hours appended first.
+    """
+    csv_path = SOURCE_FILES.get(station_id, f"dwd_hourly_{station_id}.csv")
+
+    # --- AUTO-DOWNLOAD LOGIC ---
+    if not os.path.exists(csv_path):
+        print(f"'{csv_path}' not found. Downloading via wetterdienst...")
+        _download_station_csv(station_id, csv_path)
+    elif refresh:
+        _download_station_csv(station_id, csv_path, periods="recent")
+    # ---------------------------
+
+    df = load_hourly_features(station_id, csv_path, feature_dir)
+    df['id'] = series_id(station_id)
 
-    df['id'] = 'Koeln_Bonn_Station'
-    
     # Split 80/20
     split_idx = int(len(df) * 0.8)
     train_df = df.iloc[:split_idx].copy()
     test_df = df.iloc[split_idx:].copy()
-    
+
     return train_df, test_df
 
-def plot_multivariate_forecast(ctx_df, true_df, pred_df, is_zeroshot, weather_targets):
+def plot_multivariate_forecast(ctx_df, true_df, pred_df, is_zeroshot, weather_targets, station_id=DEFAULT_STATION):
     """Visualizes the forecast for all predicted weather targets in a 2x2 grid."""
     fig, axes = plt.subplots(2, 2, figsize=(16, 10))
     axes = axes.flatten()
@@ -138,7 +307,7 @@ def plot_multivariate_forecast(ctx_df, true_df, pred_df, is_zeroshot, weather_ta
         ax = axes[i]
         
         plot_ctx = ctx_df.iloc[-100:]
-        target_id = f"Koeln_Bonn_Station_{target}"
+        target_id = f"{series_id(station_id)}_{target}"
         target_pred_df = pred_df[pred_df['item_id'] == target_id]
         
         ax.plot(plot_ctx['timestamp'], plot_ctx[target], label="Historical", color="black")
@@ -159,13 +328,94 @@ def plot_multivariate_forecast(ctx_df, true_df, pred_df, is_zeroshot, weather_ta
         if i == 0:
             ax.legend()
     
-    mode_str = "Zero-Shot" if is_zeroshot else "Fine-Tuned (Cross-Learning + Covariates)"
-    fig.suptitle(f"Köln/Bonn Weather: Native Multivariate Forecast ({mode_str})", fontsize=16)
+    mode_str = "Zero-Shot" if is_zeroshot else "Fine-Tuned (Covariates)"
+    station_label = STATION_LABELS.get(station_id, f"DWD {station_id}")
+    fig.suptitle(f"{station_label} Weather: Native Multivariate Forecast ({mode_str})", fontsize=16)
     plt.tight_layout()
-    plt.savefig("koeln_bonn_multivariate_forecast.png", dpi=300, bbox_inches='tight')
-    print("Saved plot to 'koeln_bonn_multivariate_forecast.png'")
+    plot_path = ("koeln_bonn_multivariate_forecast.png" if station_id == DEFAULT_STATION
+                 else f"dwd_{station_id}_multivariate_forecast.png")
+    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+    print(f"Saved plot to '{plot_path}'")
+
+def backtest(pipeline, test_df, targets, offsets, context_length, prediction_length,
+             quantile_levels=QUANTILE_LEVELS, chunk_size=256, batch_size=64):
+    """
+    Batched rolling-window evaluation over the test split.
+    Every offset (hours before the end of test_df) becomes one multivariate series of the
+    batch with all targets as variates, so the windows are forecast independently of each
+    other but each one still sees its time covariates. The windows are strided views of
+    test_df; they are forecast in chunks of chunk_size windows, one predict_quantiles call
+    per chunk.
+    Returns (starts, quantiles, truth): the row index where each window's context starts,
+    the forecast quantiles (n_windows, n_targets, prediction_length, n_quantiles) and the
+    true values (n_windows, n_targets, prediction_length).
+    """
+    values = test_df[targets].to_numpy(dtype=np.float32)
+    length = context_length + prediction_length
+    starts = len(values) - length - np.asarray(offsets, dtype=np.int64)
+    if starts.size and starts.min() < 0:
+        raise ValueError(
+            f"Offset {max(offsets)} needs {max(offsets) + length} test rows, the test split has {len(values)}."
+        )
+
+    # (n_rows - length + 1, n_targets, length) view, nothing is copied here
+    windows = np.lib.stride_tricks.sliding_window_view(values, length, axis=0)
+
+    quantiles = np.empty((len(starts), len(targets), prediction_length, len(quantile_levels)), dtype=np.float32)
+    for begin in range(0, len(starts), chunk_size):
+        context = np.ascontiguousarray(windows[starts[begin:begin + chunk_size], :, :context_length])
+        chunk_quantiles, _ = pipeline.predict_quantiles(
+            torch.from_numpy(context),
+            prediction_length=prediction_length,
+            quantile_levels=list(quantile_levels),
+            batch_size=batch_size
+        )
+        # One (n_targets, prediction_length, n_quantiles) tensor per window
+        quantiles[begin:begin + len(context)] = torch.stack(chunk_quantiles).float().cpu().numpy()
+
+    truth = windows[starts, :, context_length:]
+    return starts, clip_physical(quantiles, targets), truth
+
+
+def score_windows(quantiles, truth, quantile_levels=QUANTILE_LEVELS):
+    """
+    Vectorized errors of all windows and targets.
+    Returns {'MAE', 'RMSE', 'QL'} arrays of shape (n_windows, n_targets); MAE/RMSE use the
+    median forecast, QL is the mean quantile (pinball) loss over all quantile levels.
+    """
+    levels = np.asarray(quantile_levels, dtype=np.float32)
+    median = quantiles[..., int(np.argmin(np.abs(levels - 0.5)))]
+    error = median - truth
+    diff = truth[..., np.newaxis] - quantiles
+    pinball = np.maximum(levels * diff, (levels - 1) * diff)
+    return {
+        'MAE': np.nanmean(np.abs(error), axis=-1),
+        'RMSE': np.sqrt(np.nanmean(error ** 2, axis=-1)),
+        'QL': np.nanmean(pinball, axis=(-2, -1))
+    }
 
-def main(prediction_length=48, context_length=2048, zero_shot=False):
+
+def window_pred_df(window_quantiles, targets, timestamps, station_id=DEFAULT_STATION,
+                   quantile_levels=QUANTILE_LEVELS):
+    """Long prediction frame of one window in the predict_df layout used by plot_multivariate_forecast."""
+    frames = []
+    for i, target in enumerate(targets):
+        frame = pd.DataFrame(window_quantiles[i], columns=[str(q) for q in quantile_levels])
+        frame.insert(0, 'timestamp', timestamps)
+        frame.insert(0, 'item_id', f"{series_id(station_id)}_{target}")
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(prediction_length=48, context_length=2048, zero_shot=False,
+         offsets=(0, 500, 1000, 1500, 2000), eval_stride=None, eval_batch_size=64,
+         station_id=DEFAULT_STATION, refresh_data=False):
+    """
+    Fine-tunes (or loads zero-shot) Chronos-2 and backtests it on the test split.
+    With eval_stride (hours, e.g. 24) a window ends every eval_stride hours over the whole
+    test split instead of at the given offsets. refresh_data appends the latest DWD hours
+    to the station's source file before the features are loaded.
+    """
     print("Logging into Hugging Face...")
     hf_token = os.getenv("HF_TOKEN")
     if hf_token is None:
@@ -173,11 +423,11 @@ def main(prediction_length=48, context_length=2048, zero_shot=False):
     login(token=hf_token)
 
     print("Preparing dataset...")
-    train_df, test_df = prepare_dwd_data()
+    train_df, test_df = prepare_dwd_data(station_id, refresh=refresh_data)
     
     # Define Targets
-    weather_targets = ['Temp (°C)', 'Rain (mm)', 'Sun (h)', 'Wind (m/s)']
-    time_targets = ['Hour_sin', 'Hour_cos', 'Day_sin', 'Day_cos']
+    weather_targets = WEATHER_TARGETS
+    time_targets = TIME_COVARIATES
     all_targets = weather_targets + time_targets
 
     print("Loading Chronos-2 model...")
@@ -216,69 +466,41 @@ def main(prediction_length=48, context_length=2048, zero_shot=False):
 
         print("Model saved successfully!")         
 
-    print(f"Running rolling evaluation over {prediction_length}-hour windows...")
-    offsets = [0, 500, 1000, 1500, 2000]
-    
-    maes = {t: [] for t in weather_targets}
-    rmses = {t: [] for t in weather_targets}
-    plot_ctx, plot_true, plot_pred = None, None, None
+    if eval_stride:
+        last_offset = len(test_df) - context_length - prediction_length
+        offsets = list(range(0, last_offset + 1, eval_stride))
+    offsets = list(offsets)
 
-    for offset in offsets:
-        end_idx = len(test_df) - offset
-        
-        ctx_start = end_idx - prediction_length - context_length
-        ctx_end = end_idx - prediction_length
-        
-        ctx_df = test_df.iloc[ctx_start:ctx_end]
-        true_f_df = test_df.iloc[ctx_end:end_idx]
-        
-        # Melt ALL targets into the context window so the model sees the time covariates
-        long_ctx_df = ctx_df.melt(
-            id_vars=['id', 'timestamp'], 
-            value_vars=all_targets,
-            var_name='target_col', 
-            value_name='target_val'
-        )
-        long_ctx_df['item_id'] = long_ctx_df['id'] + '_' + long_ctx_df['target_col']
-        
-        pred_df = active_pipeline.predict_df(
-            long_ctx_df, 
-            prediction_length=prediction_length,
-            quantile_levels=[0.1, 0.5, 0.9],
-            id_column='item_id',
-            timestamp_column='timestamp',
-            target='target_val',
-            cross_learning=True,
-            batch_size=100
-        )
-        
-        pred_df = apply_physical_constraints(pred_df)
-                
-        print(f"\nOffset -{offset} hours:")
-        # Only calculate errors and print for the WEATHER variables
-        for target in weather_targets:
-            target_id = f"Koeln_Bonn_Station_{target}"
-            med = pred_df[pred_df['item_id'] == target_id]['0.5'].values
-            true_f = true_f_df[target].values
-            
-            window_mae = np.mean(np.abs(med - true_f))
-            window_rmse = np.sqrt(np.mean((med - true_f)**2))
-            
-            maes[target].append(window_mae)
-            rmses[target].append(window_rmse)
-            
-            print(f"  {target} -> MAE: {window_mae:.2f} | RMSE: {window_rmse:.2f}")
-        
-        if offset == 0:
-            plot_ctx, plot_true, plot_pred = ctx_df, true_f_df, pred_df
+    print(f"Running rolling evaluation over {len(offsets)} {prediction_length}-hour windows...")
+    starts, quantiles, truth = backtest(
+        active_pipeline, test_df, all_targets, offsets, context_length, prediction_length,
+        batch_size=eval_batch_size
+    )
+
+    # Only calculate errors for the WEATHER variables
+    weather_idx = [all_targets.index(t) for t in weather_targets]
+    scores = score_windows(quantiles[:, weather_idx], truth[:, weather_idx])
 
-    print("\n=== FINE-TUNED MULTIVARIATE EVALUATION ===")
-    for target in weather_targets:
-        print(f"{target} - Avg MAE: {np.mean(maes[target]):.2f} | Avg RMSE: {np.mean(rmses[target]):.2f}")
+    if len(offsets) <= 10:
+        for w, offset in enumerate(offsets):
+            print(f"\nOffset -{offset} hours:")
+            for i, target in enumerate(weather_targets):
+                print(f"  {target} -> MAE: {scores['MAE'][w, i]:.2f} | RMSE: {scores['RMSE'][w, i]:.2f} | QL: {scores['QL'][w, i]:.3f}")
+
+    print(f"\n=== {'ZERO-SHOT' if zero_shot else 'FINE-TUNED'} MULTIVARIATE EVALUATION ({len(offsets)} windows) ===")
+    for i, target in enumerate(weather_targets):
+        print(f"{target} - Avg MAE: {np.nanmean(scores['MAE'][:, i]):.2f} | "
+              f"Avg RMSE: {np.nanmean(scores['RMSE'][:, i]):.2f} | Avg QL: {np.nanmean(scores['QL'][:, i]):.3f}")
     print("==========================================\n")
 
+    # Most recent window (smallest offset)
+    w = int(np.argmax(starts))
+    ctx_df = test_df.iloc[starts[w]:starts[w] + context_length]
+    true_f_df = test_df.iloc[starts[w] + context_length:starts[w] + context_length + prediction_length]
+    pred_df = window_pred_df(quantiles[w, weather_idx], weather_targets, true_f_df['timestamp'].values, station_id)
+
     print("Plotting the most recent forecast window...")
-    plot_multivariate_forecast(plot_ctx, plot_true, plot_pred, zero_shot, weather_targets)
+    plot_multivariate_forecast(ctx_df, true_f_df, pred_df, zero_shot, weather_targets, station_id)
 
 if __name__ == "__main__":
     main(prediction_length=48, context_length=2048, zero_shot=False)
@@ -4,246 +4,558 @@ Responsible for downloading, unzipping, and parsing data from the DWD OpenData s
 fetching forecasts, and generating PV yield predictions via Linear Regression.
 """
 import csv
-import io
-import zipfile
-from datetime import datetime, timedelta
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
-import requests
-import pandas as pd
-from sklearn.linear_model import LinearRegression
+import numpy as np
 
+import chronos_forecast
+import climate_stats
 import config
+import http_cache
+import http_client
+import metrics
+import pv_model
+import singleflight
+import station_catalog
+import station_store
+from weather_table import WeatherTable
 
-def _get_float_val(row, key):
-    """Helper to safely extract float values from CSV rows."""
+_fetch_pool = ThreadPoolExecutor(max_workers=config.FETCH_WORKERS, thread_name_prefix="fetch")
+# Comparison history jobs waiting for one of the COMPARE_HISTORY_WORKERS slots
+_history_queue = deque()
+_history_slots = threading.Semaphore(config.COMPARE_HISTORY_WORKERS)
+_history_lock = threading.Lock()
+
+def fetch_station_archive(station_id, zip_ttl=None):
+    """
+    Returns the cached DWD ZIP archive (http_cache.CacheEntry) for station_id, or None if the
+    station has no archive on the server. zip_ttl overrides config.DWD_ZIP_TTL.
+    """
+    file_name = station_catalog.archive_name(config.DWD_URL, station_id, config.DWD_LISTING_TTL)
+    if not file_name:
+        return None
+    return http_cache.fetch(config.DWD_URL + file_name, ttl=config.DWD_ZIP_TTL if zip_ttl is None else zip_ttl)
+
+def fetch_historical_archive(station_id):
+    """
+    Returns the cached DWD 'historical' ZIP archive for station_id, or None if the station
+    has none or it cannot be downloaded (the recent archive is then used on its own).
+    """
     try:
-        val = float(row.get(key, -999))
-        return val if val > -900 else None
-    except (ValueError, TypeError):
+        file_name = station_catalog.archive_name(config.DWD_HISTORICAL_URL, station_id, config.DWD_HISTORICAL_TTL)
+        if not file_name:
+            return None
+        return http_cache.fetch(config.DWD_HISTORICAL_URL + file_name, ttl=config.DWD_HISTORICAL_TTL)
+    except Exception as exc: # pylint: disable=broad-exception-caught
+        print(f"DWD Historical Archive Error ({station_id}): {exc}")
         return None
 
-def _find_dwd_filename(response_text, station_id):
-    """Parses the DWD directory HTML to find the correct zip file for a station."""
-    search_pattern = f"_{station_id}_akt.zip"
-    for line in response_text.splitlines():
-        if search_pattern in line and "href" in line:
-            start = line.find('href="') + 6
-            end = line.find('">', start)
-            potential = line[start:end]
-            if search_pattern in potential:
-                return potential
-    return None
+def load_station(station_id, zip_ttl=None):
+    """
+    Returns the merged historical + recent StationData of station_id (see station_store),
+    or None if the station has no recent archive on the server.
+    """
+    zip_entry = fetch_station_archive(station_id, zip_ttl=zip_ttl)
+    if zip_entry is None:
+        return None
+    return station_store.get_station_data(station_id, zip_entry, fetch_historical_archive(station_id))
 
-def get_forecast_data(station_id, days_ahead=7):
-    """Fetches weather forecast from Open-Meteo API using the DWD ICON model."""
-    if station_id not in config.STATION_COORDS:
-        return []
-        
-    lat, lon = config.STATION_COORDS[station_id]
-    days_to_request = max(days_ahead, 1)
-
-    url = "https://api.open-meteo.com/v1/forecast"
+def station_name(station_id):
+    """Display name of a configured or catalog station (None if unknown)."""
+    if station_id in config.STATIONS:
+        return config.STATIONS[station_id]
+    station = station_catalog.get_station(station_id)
+    return station.name if station is not None else None
+
+def station_coords(station_id):
+    """(lat, lon) of a configured or catalog station (None if unknown)."""
+    if station_id in config.STATION_COORDS:
+        return config.STATION_COORDS[station_id]
+    station = station_catalog.get_station(station_id)
+    return (station.lat, station.lon) if station is not None else None
+
+_forecast_cache = {"run": None, "batches": {}}
+
+def _forecast_path(run, batch):
+    return os.path.join(config.CACHE_DIR, "forecast", f"{run}_{batch}.json")
+
+def _remember_forecasts(run, batch, daily):
+    if _forecast_cache["run"] != run:
+        _forecast_cache.update(run=run, batches={})
+    _forecast_cache["batches"][batch] = daily
+
+def _load_or_fetch_forecasts(run, batch, coords):
+    """Returns {station_id: daily} for the stations in coords, from disk or from one Open-Meteo call."""
+    station_ids = sorted(coords)
+    try:
+        with open(_forecast_path(run, batch), "r", encoding="utf-8") as f_obj:
+            cached = json.load(f_obj)
+        if cached.get("stations") == station_ids:
+            _remember_forecasts(run, batch, cached["daily"])
+            return cached["daily"]
+    except (OSError, ValueError):
+        pass
+
+    # Open-Meteo accepts comma-separated coordinate lists and answers with one object per location
     params = {
-        "latitude": lat,
-        "longitude": lon,
+        "latitude": ",".join(str(coords[sid][0]) for sid in station_ids),
+        "longitude": ",".join(str(coords[sid][1]) for sid in station_ids),
         "daily": ["temperature_2m_max", "temperature_2m_min", "precipitation_sum", "sunshine_duration", "wind_speed_10m_max"],
-        "timezone": "Europe/Berlin",
+        "timezone": config.FORECAST_TIMEZONE,
         "models": "icon_d2",
-        "forecast_days": days_to_request
+        "forecast_days": max(max(config.FORECAST_RANGES), 1)
+    }
+    response = http_client.get(config.FORECAST_API_URL, params=params)
+    response.raise_for_status()
+    locations = response.json()
+    if isinstance(locations, dict):
+        locations = [locations]
+    daily = {sid: loc.get("daily", {}) for sid, loc in zip(station_ids, locations)}
+
+    forecast_dir = os.path.dirname(_forecast_path(run, batch))
+    os.makedirs(forecast_dir, exist_ok=True)
+    for name in os.listdir(forecast_dir):  # Results of older runs are no longer needed
+        if name.endswith(".json") and not name.startswith(f"{run}_"):
+            try:
+                os.remove(os.path.join(forecast_dir, name))
+            except OSError:
+                pass
+    http_cache.atomic_write(_forecast_path(run, batch), json.dumps({"stations": station_ids, "daily": daily}).encode("utf-8"))
+    _remember_forecasts(run, batch, daily)
+    return daily
+
+def get_forecast_batch(station_ids=None):
+    """
+    Returns the Open-Meteo daily forecasts (maximum FORECAST_RANGES horizon) as
+    {station_id: daily} for station_ids (default: all of config.STATION_COORDS).
+    All configured stations are fetched in one request per forecast model run, other
+    catalog stations in one request each; results are shared by all threads and worker
+    processes until the next run.
+    """
+    run = forecast_run()
+    if station_ids is None:
+        station_ids = config.STATION_COORDS
+    batches = {}
+    for sid in station_ids:
+        if sid in config.STATION_COORDS:
+            batches["stations"] = config.STATION_COORDS
+        else:
+            coords = station_coords(sid)
+            if coords is not None:
+                batches[sid] = {sid: coords}
+
+    result = {}
+    for batch, coords in batches.items():
+        daily = _forecast_cache["batches"].get(batch) if _forecast_cache["run"] == run else None
+        if daily is None:
+            daily = singleflight.do(("forecast", run, batch),
+                                    lambda batch=batch, coords=coords: _load_or_fetch_forecasts(run, batch, coords),
+                                    across_processes=True)
+        result.update((sid, daily[sid]) for sid in station_ids if sid in daily)
+    return result
+
+def get_forecast_columns(station_id, days_ahead):
+    """
+    Returns the Open-Meteo forecast (DWD ICON model) for the next days_ahead days of a station
+    as {"dates", "temp", "rain", "sun", "wind"} NumPy columns (date ordinals, NaN for gaps).
+    """
+    with metrics.stage("forecast"):
+        daily = get_forecast_batch([station_id]).get(station_id)
+    if daily is None:
+        raise LookupError(f"No coordinates for station {station_id}.")
+    times = daily.get("time", [])[:days_ahead]
+    n = len(times)
+
+    def column(name):
+        return np.array(daily.get(name, [None] * n)[:n], dtype=np.float64)
+
+    t_max, t_min = column("temperature_2m_max"), column("temperature_2m_min")
+    return {
+        "dates": np.array([datetime.strptime(t, "%Y-%m-%d").toordinal() for t in times], dtype=np.int64),
+        "temp": (t_max + t_min) / 2,
+        "rain": column("precipitation_sum"),
+        "sun": np.nan_to_num(column("sunshine_duration") / 3600),
+        "wind": column("wind_speed_10m_max")
     }
 
+def get_forecast_data(station_id, days_ahead=7):
+    """Returns the Open-Meteo forecast (DWD ICON model) for the next days_ahead days as a WeatherTable (None on failure)."""
+    if station_coords(station_id) is None:
+        return None
+
     try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        daily = data.get("daily", {})
-        times = daily.get("time", [])
-        
-        forecast_rows = []
-        for i, date_str in enumerate(times):
-            if i >= days_ahead:
-                break
-
-            t_max = daily["temperature_2m_max"][i]
-            t_min = daily["temperature_2m_min"][i]
-            t_avg = (t_max + t_min) / 2 if t_max is not None and t_min is not None else None
-            
-            sun_sec = daily["sunshine_duration"][i]
-            sun_hours = sun_sec / 3600 if sun_sec is not None else 0
-            wind = daily.get("wind_speed_10m_max", [None])[i]
-
-            forecast_rows.append({
-                "date": datetime.strptime(date_str, "%Y-%m-%d").strftime('%d.%m.%Y'),
-                "date_obj": datetime.strptime(date_str, "%Y-%m-%d"),
-                "temp": t_avg,
-                "rain": daily["precipitation_sum"][i],
-                "sun": sun_hours,
-                "wind": wind,
-                "temp_fmt": f"{t_avg:.1f}" if t_avg is not None else "-",
-                "rain_fmt": f"{daily['precipitation_sum'][i]:.1f}" if daily["precipitation_sum"][i] is not None else "-",
-                "sun_fmt": f"{sun_hours:.2f}" if sun_hours is not None else "-",
-                "wind_fmt": f"{wind:.1f}" if wind is not None else "-",
-                "type": "forecast"
-            })
-        return forecast_rows
+        return WeatherTable(get_forecast_columns(station_id, days_ahead))
     except Exception as exc:
         print(f"Forecast Error: {exc}")
-        return []
+        return None
 
-def get_weather_data(days_back=30, station_id="02667"):
-    """Fetches historical weather data from the DWD OpenData server."""
+def get_history_columns(station_id, first_ordinal, last_ordinal, level="day", climate=False):
+    """
+    Returns the DWD observations of station_id between two date ordinals (inclusive) as
+    ({"dates", "temp", "rain", "sun", "wind"}, archive_version). Dates are ascending ordinals,
+    values float32 with NaN for missing data. With level="month"/"year" the precomputed
+    aggregates of all periods starting in the window are returned instead of daily values.
+    climate=True adds the daily normals, rolling means and anomalies (see climate_stats).
+    Raises LookupError for unknown stations.
+    """
+    station = data = load_station(station_id)
+    if data is None:
+        raise LookupError(f"File for station {station_id} not found on server.")
+    version = data.version
+    if level != "day":
+        data = data.aggregates[level]
+
+    # Binary search for the requested window instead of scanning every row
+    window = data.window(first_ordinal, last_ordinal)
+    columns = {
+        "dates": data.dates[window],
+        "temp": data.temp[window],
+        "rain": data.rain[window],
+        "sun": data.sun[window],
+        "wind": data.wind[window]
+    }
+    if climate and level == "day":
+        try:
+            columns.update(climate_stats.get_stats(station_id, station).columns(window))
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Climate Stats Error ({station_id}): {exc}")
+    return columns, version
+
+def summarize(columns):
+    """Average temperature and rain/sun totals of a history window."""
+    temps = columns["temp"]
+    return {
+        "avg_temp": round(float(np.nanmean(temps, dtype=np.float64)), 2) if np.any(~np.isnan(temps)) else 0,
+        "sum_rain": round(float(np.nansum(columns["rain"], dtype=np.float64)), 2),
+        "sum_sun": round(float(np.nansum(columns["sun"], dtype=np.float64)), 2)
+    }
+
+def history_window(days_back):
+    """First and last date ordinal (inclusive) of the 'last days_back days' window."""
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days_back)
-    rows = []
-    summary = {"avg_temp": 0, "sum_rain": 0, "sum_sun": 0}
-    temps = []
+    return start_date.toordinal() + 1, end_date.toordinal()
 
+def history_level(days_back):
+    """Resolution of the dashboard rows: daily values, or monthly aggregates for long windows."""
+    return "day" if days_back <= config.AGGREGATE_ABOVE_DAYS else "month"
+
+def get_weather_data(days_back=30, station_id="02667"):
+    """
+    Fetches historical weather data from the DWD OpenData server as (WeatherTable, summary),
+    or (None, error message). Windows longer than AGGREGATE_ABOVE_DAYS are returned as
+    monthly rows (mean temp, rain/sun totals, max wind, table.period = 'month'); the summary
+    always covers the daily values.
+    """
+    first, last = history_window(days_back)
     try:
-        response = requests.get(config.DWD_URL, timeout=10)
-        file_name = _find_dwd_filename(response.text, station_id)
-        if not file_name:
-            return None, f"File for station {station_id} not found on server."
-
-        zip_resp = requests.get(config.DWD_URL + file_name, timeout=30)
-        with zipfile.ZipFile(io.BytesIO(zip_resp.content)) as z_file:
-            data_filename = [n for n in z_file.namelist() if n.startswith("produkt_")][0]
-            with z_file.open(data_filename) as f_obj:
-                content = f_obj.read().decode('utf-8')
-                reader = csv.DictReader(content.splitlines(), delimiter=';')
-                reader.fieldnames = [name.strip() for name in reader.fieldnames]
-                
-                date_col = "MESS_DATUM" if "MESS_DATUM" in reader.fieldnames else "MESS_DATUM_BEGINN"
-
-                for row in reader:
-                    try:
-                        date_obj = datetime.strptime(row[date_col], "%Y%m%d")
-                    except ValueError:
-                        continue
-                    
-                    if start_date <= date_obj <= end_date:
-                        temp = _get_float_val(row, 'TMK')
-                        rain = _get_float_val(row, 'RSK')
-                        sun = _get_float_val(row, 'SDK')
-                        wind = _get_float_val(row, 'FX')
-                        
-                        rows.append({
-                            "date": date_obj.strftime('%d.%m.%Y'),
-                            "date_obj": date_obj,
-                            "temp": temp,
-                            "rain": rain,
-                            "sun": sun,
-                            "wind": wind,
-                            "temp_fmt": f"{temp:.1f}" if temp is not None else "-",
-                            "rain_fmt": f"{rain:.1f}" if rain is not None else "-",
-                            "sun_fmt": f"{sun:.2f}" if sun is not None else "-",
-                            "wind_fmt": f"{wind:.1f}" if wind is not None else "-"
-                        })
-                        if rain: summary["sum_rain"] += rain
-                        if sun: summary["sum_sun"] += sun
-                        if temp: temps.append(temp)
+        with metrics.stage("dwd_history"):
+            level = history_level(days_back)
+            columns, _ = get_history_columns(station_id, first, last, climate=level == "day")
+            if level == "day":
+                return WeatherTable(columns, newest_first=True), summarize(columns)
+            aggregated, _ = get_history_columns(station_id, first, last, level=level)
     except Exception as exc:
         return None, str(exc)
 
-    if temps: summary["avg_temp"] = round(sum(temps)/len(temps), 2)
-    summary["sum_rain"] = round(summary["sum_rain"], 2)
-    summary["sum_sun"] = round(summary["sum_sun"], 2)
-    rows.reverse()
-    return rows, summary
+    return WeatherTable(aggregated, newest_first=True, date_format='%m.%Y', period=level), summarize(columns)
 
-# Stelle sicher, dass pd und LinearRegression importiert sind (oben in der Datei):
-# import pandas as pd
-# from sklearn.linear_model import LinearRegression
+_pv_sheet = {"content_hash": None, "sheet": None}
 
-def enrich_with_pv_data(historical_rows, forecast_rows):
+def fetch_pv_sheet():
     """
-    Fetches PV data, trains the linear regression model, and enriches both 
-    historical and forecast rows with 'pv_actual' and 'pv_predicted' values.
+    Downloads the PV yield Google Sheet (CSV export) and parses it into a pv_model.PVSheet.
+    The parsed sheet is reused as long as the sheet's content hash is unchanged.
     """
-    if not historical_rows and not forecast_rows:
-        return historical_rows, forecast_rows
+    with metrics.stage("pv_sheet"):
+        entry = http_cache.fetch(config.PV_DATA_URL, ttl=config.PV_SHEET_TTL)
+        content_hash = entry.meta.get("sha1")
+        if _pv_sheet["content_hash"] == content_hash:
+            return _pv_sheet["sheet"]
+        return singleflight.do(("pv_sheet", content_hash), lambda: _parse_pv_sheet(entry.path, content_hash))
 
+def _sheet_day(text):
     try:
-        import config  # Falls noch nicht global importiert
-        import pandas as pd
-        from sklearn.linear_model import LinearRegression
-        
-        # --- FIX: Standard-Dezimalzeichen (.) wird automatisch von Pandas erkannt ---
-        df = pd.read_csv(config.PV_DATA_URL) 
-        df['Tag'] = pd.to_datetime(df['Tag'], format='%d.%m.%Y', errors='coerce')
-        
-        features = ['TagImJahr', 'Temperatur (°C)', 'Niederschlag (mm)', 'Sonnenstunden (h)']
-        target = 'PV-Ertrag (kWh)'
-        
-        # --- FIX: Einfache Konvertierung zu numerischen Werten ---
-        for col in features + [target]:
-            if col in df.columns:
-                # Fehlerhafte Werte (Texte/Leerzeilen) werden zu NaN (Not a Number)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Train the model
-        cutoff_train_date = pd.Timestamp(datetime.now() - timedelta(days=config.PV_TRAINING_DAYS))
-        train_df = df.dropna(subset=features + [target])
-        train_df = train_df[train_df['Tag'] >= cutoff_train_date]
-        
-        model = None
-        if not train_df.empty:
-            x_train = train_df[features]
-            y_train = train_df[target]
-            model = LinearRegression()
-            model.fit(x_train, y_train)
-
-        # Dictionary for fast lookup of actual PV data by date
-        actual_pv_dict = df.dropna(subset=[target]).set_index('Tag')[target].to_dict()
-
-        # Helper to predict PV for a single row
-        def predict_for_row(row_data):
-            if model is None or row_data.get('temp') is None:
-                return None
-            day_of_year = row_data['date_obj'].timetuple().tm_yday
-            rain = row_data.get('rain') or 0.0
-            sun = row_data.get('sun') or 0.0
-            
-            pred_df = pd.DataFrame([[day_of_year, row_data['temp'], rain, sun]], columns=features)
-            pred_val = model.predict(pred_df)[0]
-            return max(0.0, float(pred_val)) # Stelle sicher, dass es ein Float ist
-
-        # Helper for safe string formatting
-        def format_val(val):
-            if val is None or pd.isna(val):
-                return "-"
-            return f"{float(val):.2f}"
-
-        # Enrich Historical Rows
-        if historical_rows:
-            for row in historical_rows:
-                date_ts = pd.Timestamp(row['date_obj'])
-                actual = actual_pv_dict.get(date_ts, None)
-                predicted = predict_for_row(row)
-
-                # Speichere saubere Zahlen oder None
-                row['pv_actual'] = float(actual) if actual is not None and not pd.isna(actual) else None
-                row['pv_predicted'] = predicted
-                
-                # Speichere formatierte Strings für die HTML Tabelle
-                row['pv_actual_fmt'] = format_val(row['pv_actual'])
-                row['pv_predicted_fmt'] = format_val(row['pv_predicted'])
-
-        # Enrich Forecast Rows
-        if forecast_rows:
-            for row in forecast_rows:
-                predicted = predict_for_row(row)
-                
-                row['pv_actual'] = None # Forecast has no actual PV yield yet
-                row['pv_predicted'] = predicted
-                row['pv_actual_fmt'] = "-"
-                row['pv_predicted_fmt'] = format_val(predicted)
+        return datetime.strptime(text.strip(), '%d.%m.%Y').toordinal()
+    except ValueError:
+        return 0
 
+def _sheet_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+def _parse_pv_sheet(path, content_hash):
+    # Plain csv module instead of pandas: a worker serving pages never has to import pandas
+    with open(path, "r", encoding="utf-8-sig", newline="") as f_obj:
+        reader = csv.reader(f_obj)
+        header = [name.strip() for name in next(reader, [])]
+        rows = [row for row in reader if any(cell.strip() for cell in row)]
+
+    def cells(name):
+        idx = header.index(name)
+        return [row[idx] if idx < len(row) else "" for row in rows]
+
+    days = [_sheet_day(text) for text in cells('Tag')] if 'Tag' in header else [0] * len(rows)
+    columns = {}
+    for col in pv_model.PV_FEATURES + [pv_model.PV_TARGET]:
+        if col in header:
+            # Fehlerhafte Werte (Texte/Leerzeilen) werden zu NaN (Not a Number)
+            columns[col] = [_sheet_number(text) for text in cells(col)]
+
+    sheet = pv_model.PVSheet(days, columns, content_hash)
+    _pv_sheet.update(content_hash=content_hash, sheet=sheet)
+    return sheet
+
+def refresh_pv_model():
+    """Forces a fresh download of the PV sheet and a refit of the model on the next request."""
+    http_cache.invalidate(config.PV_DATA_URL)
+    _pv_sheet.update(content_hash=None, sheet=None)
+    pv_model.refresh()
+
+def pv_columns(pv_sheet, ordinals, temps, rains, suns):
+    """
+    Returns (actual, predicted) PV yield arrays for the given days, NaN where unknown.
+    The regression model is fitted only when the sheet or the training window changed.
+    """
+    model = pv_model.get_model(pv_sheet)
+    if model is not None:
+        predicted = pv_model.predict_batch(model, ordinals, temps, rains, suns)
+    else:
+        predicted = np.full(len(ordinals), np.nan)
+    return pv_model.actual_yield(pv_sheet, ordinals), predicted
+
+def enrich_with_pv_data(history, forecast, pv_sheet):
+    """
+    Predicts PV yield with the registered linear regression model (see pv_model) and adds
+    'pv_actual' and 'pv_predicted' columns to the history and forecast WeatherTables.
+    Pass pv_sheet=None if the sheet could not be fetched; the PV columns are then left empty.
+    """
+    tables = [table for table in (history, forecast) if table is not None]
+    for table in tables:
+        table.set_column('pv_actual', np.full(len(table), np.nan))
+        table.set_column('pv_predicted', np.full(len(table), np.nan))
+    # The daily model does not apply to monthly aggregates
+    daily = [table for table in tables if table.period is None and len(table)]
+    if not daily:
+        return history, forecast
+
+    try:
+        if pv_sheet is None:
+            raise ValueError("PV sheet not available")
+
+        # One feature matrix for all historical and forecast days
+        actual, predicted = pv_columns(
+            pv_sheet,
+            np.concatenate([table.dates for table in daily]),
+            *(np.concatenate([table.column(name) for table in daily]) for name in ("temp", "rain", "sun")))
+        start = 0
+        for table in daily:
+            end = start + len(table)
+            # Forecast has no actual PV yield yet
+            table.set_column('pv_actual', actual[start:end] if table is history else np.full(len(table), np.nan))
+            table.set_column('pv_predicted', predicted[start:end])
+            start = end
     except Exception as exc:
         print(f"PV Enrichment Error: {exc}")
-        # Fallback to empty values if Google Sheet fails
-        for r in (historical_rows or []) + (forecast_rows or []):
-            r['pv_actual'] = r['pv_predicted'] = None
-            r['pv_actual_fmt'] = r['pv_predicted_fmt'] = "-"
 
-    return historical_rows, forecast_rows
+    return history, forecast
+
+def forecast_run(now=None):
+    """
+    Identifier of the most recent forecast model run plus the local forecast date (e.g.
+    '2024061509-20240615' for the 09 UTC run). The daily values start at local midnight,
+    so the 21 UTC run is fetched again once the day changes in FORECAST_TIMEZONE.
+    """
+    now = now or datetime.utcnow()
+    run_hour = now.hour // config.FORECAST_RUN_INTERVAL_HOURS * config.FORECAST_RUN_INTERVAL_HOURS
+    local_day = now.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(config.FORECAST_TIMEZONE))
+    return f"{now:%Y%m%d}{run_hour:02d}-{local_day:%Y%m%d}"
+
+def data_versions(station_id):
+    """
+    Returns the versions of all upstream datasets a dashboard page for station_id depends on.
+    Only consults the local HTTP cache (and revalidates entries whose TTL has expired).
+    """
+    zip_entry = fetch_station_archive(station_id)
+    pv_entry = http_cache.fetch(config.PV_DATA_URL, ttl=config.PV_SHEET_TTL)
+    dwd_version = None
+    if zip_entry is not None:
+        dwd_version = station_store.store_version(station_id, zip_entry, fetch_historical_archive(station_id))
+
+    return {
+        "day": datetime.now().date().isoformat(),  # History window and PV training window move daily
+        "dwd": dwd_version,
+        "forecast": forecast_run(),
+        "chronos": chronos_forecast.version(),
+        "pv": pv_entry.meta.get("sha1")
+    }
+
+def fetch_all(station_id, days_back, days_forecast):
+    """
+    Runs the three upstream fetches (DWD history, Open-Meteo forecast, PV sheet) concurrently,
+    so page latency is bounded by the slowest source instead of the sum of all three.
+    Each source has its own deadline (config.FETCH_DEADLINES); a source that misses it is
+    treated like a failed fetch.
+    Returns (history, summary_or_error, forecast, pv_sheet) with WeatherTables (None if missing).
+    """
+    started = time.monotonic()
+    futures = {
+        "history": _fetch_pool.submit(metrics.bind(get_weather_data), days_back=days_back, station_id=station_id),
+        "forecast": _fetch_pool.submit(metrics.bind(get_forecast_data), station_id, days_ahead=days_forecast),
+        "pv": _fetch_pool.submit(metrics.bind(fetch_pv_sheet))
+    }
+
+    results = {}
+    for name, future in futures.items():
+        remaining = config.FETCH_DEADLINES[name] - (time.monotonic() - started)
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+            continue
+        except FuturesTimeout:
+            future.cancel()
+            message = f"Timed out after {config.FETCH_DEADLINES[name]} s."
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            message = str(exc)
+        print(f"Fetch Error ({name}): {message}")
+        results[name] = {"history": (None, message), "forecast": None, "pv": None}[name]
+
+    history, summary_or_error = results["history"]
+    return history, summary_or_error, results["forecast"], results["pv"]
+
+def join_columns(per_station, fields):
+    """
+    Joins per-station column dicts (ascending, unique "dates") on the union of their dates.
+    Returns {"dates": ordinals, field: stations x dates float64 matrix} with NaN where a
+    station has no value; each station is scattered into place with one searchsorted.
+    """
+    if per_station:
+        dates = np.unique(np.concatenate([np.asarray(c["dates"], dtype=np.int64) for c in per_station]))
+    else:
+        dates = np.empty(0, dtype=np.int64)
+    joined = {"dates": dates}
+    for field in fields:
+        joined[field] = np.full((len(per_station), len(dates)), np.nan)
+    for i, columns in enumerate(per_station):
+        index = np.searchsorted(dates, columns["dates"])
+        for field in fields:
+            joined[field][i, index] = columns[field]
+    return joined
+
+def _comparison_history(station_id, days_back):
+    """History columns of one comparison station plus the summary of its daily values."""
+    first, last = history_window(days_back)
+    level = history_level(days_back)
+    with metrics.stage("dwd_history"):
+        columns, _ = get_history_columns(station_id, first, last)
+        summary = summarize(columns)
+        if level != "day":
+            columns, _ = get_history_columns(station_id, first, last, level=level)
+    return columns, summary
+
+def _submit_history(station_id, days_back):
+    """
+    Queues the history job of one comparison station and returns its Future. At most
+    COMPARE_HISTORY_WORKERS of these jobs run on the fetch pool at once, across all
+    requests, so comparisons never occupy the whole pool; queued jobs wait without holding
+    a pool thread and can still be cancelled.
+    """
+    future = Future()
+    with _history_lock:
+        _history_queue.append((future, metrics.bind(_comparison_history), (station_id, days_back)))
+    _dispatch_histories()
+    return future
+
+def _dispatch_histories():
+    """Starts queued history jobs while slots are free (called after queueing and after every job)."""
+    while True:
+        with _history_lock:
+            if not _history_queue or not _history_slots.acquire(blocking=False):
+                return
+            future, fn, args = _history_queue.popleft()
+        if not future.set_running_or_notify_cancel():  # Cancelled while queued
+            _history_slots.release()
+            continue
+        _fetch_pool.submit(_run_history, future, fn, args)
+
+def _run_history(future, fn, args):
+    try:
+        future.set_result(fn(*args))
+    except BaseException as exc: # pylint: disable=broad-exception-caught
+        future.set_exception(exc)
+    finally:
+        _history_slots.release()
+        _dispatch_histories()
+
+def fetch_comparison(station_ids, days_back, days_forecast):
+    """
+    Loads history and forecast of several stations plus the PV sheet concurrently on the
+    shared fetch pool. Stations whose data is already cached cost no network time. The
+    small forecast and PV jobs are queued before the history downloads, which share
+    COMPARE_HISTORY_WORKERS slots with all other comparisons (see _submit_history); the
+    FETCH_DEADLINES apply per source as in fetch_all. Returns
+    (history, forecast, summaries, pv_sheet): history and forecast are joined with
+    join_columns over the stations in station_ids order, summaries maps each station id
+    to its summary dict or an error message.
+    """
+    started = time.monotonic()
+    forecast_futures = [_fetch_pool.submit(metrics.bind(get_forecast_columns), sid, days_forecast) for sid in station_ids]
+    pv_future = _fetch_pool.submit(metrics.bind(fetch_pv_sheet))
+    history_futures = [_submit_history(sid, days_back) for sid in station_ids]
+
+    def result(name, future, default):
+        remaining = config.FETCH_DEADLINES[name] - (time.monotonic() - started)
+        try:
+            return future.result(timeout=max(remaining, 0)), None
+        except FuturesTimeout:
+            future.cancel()
+            message = f"Timed out after {config.FETCH_DEADLINES[name]} s."
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            message = str(exc)
+        print(f"Fetch Error ({name}): {message}")
+        return default, message
+
+    empty = {"dates": np.empty(0, dtype=np.int64), **{c: np.empty(0) for c in ("temp", "rain", "sun", "wind")}}
+    histories, forecasts, summaries = [], [], {}
+    for sid, future in zip(station_ids, history_futures):
+        (columns, summary), error = result("history", future, (empty, None))
+        histories.append(columns)
+        summaries[sid] = summary if error is None else error
+    for future in forecast_futures:
+        forecasts.append(result("forecast", future, empty)[0])
+    pv_sheet = result("pv", pv_future, None)[0]
+
+    fields = ("temp", "rain", "sun", "wind")
+    history, forecast = join_columns(histories, fields), join_columns(forecasts, fields)
+    return history, forecast, summaries, pv_sheet
+
+def comparison_pv(history, forecast, pv_sheet, level="day"):
+    """
+    Adds pv_predicted matrices (per station, from its weather) and the pv_actual row of the
+    sheet to joined comparison columns. Monthly histories keep NaN PV columns.
+    """
+    for joined in (history, forecast):
+        n_stations, n_days = joined["temp"].shape
+        joined["pv_predicted"] = np.full((n_stations, n_days), np.nan)
+        joined["pv_actual"] = np.full(n_days, np.nan)
+        if pv_sheet is None or not n_days or (joined is history and level != "day"):
+            continue
+        try:
+            # One prediction for all stations: the station x day matrices are flattened row by row
+            model = pv_model.get_model(pv_sheet)
+            if model is not None:
+                joined["pv_predicted"] = pv_model.predict_batch(
+                    model, np.tile(joined["dates"], n_stations), joined["temp"].ravel(),
+                    joined["rain"].ravel(), joined["sun"].ravel()).reshape(n_stations, n_days)
+            joined["pv_actual"] = pv_model.actual_yield(pv_sheet, joined["dates"])
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"PV Enrichment Error: {exc}")
+    return history, forecast
@@ -0,0 +1,99 @@
+"""
+Columnar weather records for the DWD Station Climate Plotter.
+A WeatherTable keeps the days (or months) of a history or forecast window as NumPy columns
+from weather_logic through the PV enrichment to plotting and the JSON API. Table rows for
+the template are lightweight views that format their values only when they are rendered.
+"""
+from datetime import datetime
+
+import numpy as np
+
+VALUE_COLUMNS = ("temp", "rain", "sun", "wind")
+
+# Decimal places of the table cells ('-' for missing values)
+DISPLAY_DIGITS = {"temp": 1, "rain": 1, "sun": 2, "wind": 1, "pv_actual": 2, "pv_predicted": 2}
+# Decimal places of the values in the plot and JSON payloads
+DISPLAY_PRECISION = 3
+
+
+class WeatherRow:
+    """
+    One table row as seen by the template: row.date, row.temp, row.temp_fmt, ...
+    Values are looked up in the table columns and formatted on access.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def date_obj(self):
+        return datetime.fromordinal(int(self._table.dates[self._index]))
+
+    @property
+    def date(self):
+        return self.date_obj.strftime(self._table.date_format)
+
+    def get(self, name, default=None):
+        """Value of column name as float, or default if it is missing or NaN."""
+        values = self._table.columns.get(name)
+        if values is None or np.isnan(values[self._index]):
+            return default
+        return float(values[self._index])
+
+    def __getattr__(self, name):
+        if name.endswith("_fmt") and name[:-4] in DISPLAY_DIGITS:
+            value = self.get(name[:-4])
+            return "-" if value is None else f"{value:.{DISPLAY_DIGITS[name[:-4]]}f}"
+        if name in self._table.columns:
+            return self.get(name)
+        raise AttributeError(name)
+
+
+class WeatherTable:
+    """
+    Days (or aggregated periods) with ascending "dates" ordinals and float64 value columns
+    (NaN for missing values). newest_first only sets the order in which rows are iterated
+    for the HTML tables; columns are always ascending. period is None for daily values or
+    the aggregate level ('month').
+    """
+
+    def __init__(self, columns, newest_first=False, date_format='%d.%m.%Y', period=None):
+        self.dates = np.asarray(columns["dates"], dtype=np.int64)
+        self.columns = {name: np.asarray(values, dtype=np.float64)
+                        for name, values in columns.items() if name != "dates"}
+        self.newest_first = newest_first
+        self.date_format = date_format
+        self.period = period
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __iter__(self):
+        indices = range(len(self) - 1, -1, -1) if self.newest_first else range(len(self))
+        return (WeatherRow(self, i) for i in indices)
+
+    def __getitem__(self, position):
+        """Row at position in iteration order (newest first if newest_first)."""
+        index = range(len(self) - 1, -1, -1)[position] if self.newest_first else range(len(self))[position]
+        return WeatherRow(self, index)
+
+    def column(self, name):
+        """Column name as a float64 array (all NaN if the table has no such column)."""
+        values = self.columns.get(name)
+        return values if values is not None else np.full(len(self), np.nan)
+
+    def display_column(self, name):
+        """
+        Column name rounded to DISPLAY_PRECISION for the plot and JSON payloads. The stored
+        columns keep full precision, since they are also the PV model inputs.
+        """
+        return np.round(self.column(name), DISPLAY_PRECISION)
+
+    def has_column(self, name):
+        return name in self.columns
+
+    def set_column(self, name, values):
+        self.columns[name] = np.asarray(values, dtype=np.float64)